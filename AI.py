@@ -1,25 +1,56 @@
 # ------------------- IMPORTS -------------------
-
-# PDF Report Libraries
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-from reportlab.lib.units import inch
+# PyPDF2 is imported by the function that uses it
 
 # Custom files
-from query_data import query_rag
-from chroma_db import update_chroma, clear_database
-from db import add_report
+from query_data import query_rag_stream
+from chroma_db import update_chroma
+from reports import save_report
+from risk_parser import RiskStreamParser, RISK_SCHEMA
+from constants import REPORT_SECTION_WORKERS, REPORT_SECTION_RETRIES, REPORT_OUTPUT_FORMAT
 
 # Other imports
 from datetime import datetime
 import re
-import io
 import os
-from nicegui import ui
-import PyPDF2
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Sections of the risk report, each one runs its own retrieval and question to the model
+# retrieval holds the options passed to retrieve, e.g. the document types searched for the section
+REPORT_SECTIONS = [
+    {
+        "title": "General Risks",
+        "topic": "general project risks based on given context from the project charter",
+        "retrieval": {"doc_types": ["charter"]},
+    },
+    {
+        "title": "Schedule Risks",
+        "topic": "risks to the project schedule, such as deadlines, milestones and delays",
+        "retrieval": {},
+    },
+    {
+        "title": "Budget Risks",
+        "topic": "risks to the project budget, such as costs, funding and resources",
+        "retrieval": {},
+    },
+    {
+        "title": "Technical Risks",
+        "topic": "technical risks, such as technologies, integrations, quality and requirements",
+        "retrieval": {},
+    },
+    {
+        "title": "Action Items from Meeting Minutes",
+        "topic": "open issues and action items from the meeting minutes, with the action to take as the risk mitigation way",
+        "retrieval": {"doc_types": ["minutes"]},
+    },
+]
+
+# Bounded pool for the sections of reports, caps the questions sent to the model at the same time
+section_executor = ThreadPoolExecutor(max_workers=REPORT_SECTION_WORKERS, thread_name_prefix='report-section')
 
 # Function to parse risks from a text using a specific pattern
+# Used for the "Risk N:" layout, and for answers that ignored the JSON format
 def parse_risks(text):
     risks = []
     risk_pattern = re.compile(
@@ -39,62 +70,15 @@ def parse_risks(text):
 
     return risks
 
-# Function to create a risk report PDF
-def create_risk_report(risks, current_date):
-    # Create an in-memory file object
-    buffer = io.BytesIO()
-    # Create the PDF document
-    doc = SimpleDocTemplate(buffer, pagesize=A4)
-    styles = getSampleStyleSheet()
-    style_normal = styles['Normal']
-    style_heading = styles['Heading1']
-    style_subheading = styles['Heading2']
-
-    # Define a custom style for the risk section
-    style_risk = ParagraphStyle(
-        'RiskStyle',
-        parent=style_normal,
-        spaceBefore=12,
-        spaceAfter=12,
-        leftIndent=12,
-        rightIndent=12,
-        bulletIndent=12,
-        leading=15
-    )
-
-    elements = []
-
-    # Add a title
-    elements.append(Paragraph("Risk Management Report", style_heading))
-    elements.append(Paragraph(f"Date: {current_date}", style_subheading))
-    elements.append(Spacer(1, 0.4 * inch))
-
-    # Add risks to the document
-    for idx, risk in enumerate(risks, start=1):
-        elements.append(Paragraph(f"Risk {idx}:", style_subheading))
-        elements.append(Paragraph(f"<b>Risk Name:</b> {risk['Risk Name']}", style_risk))
-        elements.append(Paragraph(f"<b>Risk Description:</b> {risk['Risk Description']}", style_risk))
-        elements.append(Paragraph(f"<b>Probability:</b> {risk['Probability']}", style_risk))
-        elements.append(Paragraph(f"<b>Context Explanation:</b> {risk['Context Explanation']}", style_risk))
-        elements.append(Paragraph(f"<b>Risk Mitigation Way:</b> {risk['Risk Mitigation Way']}", style_risk))
-        elements.append(Spacer(1, 0.2 * inch))
-
-    # Build the PDF
-    doc.build(elements)
-    # Move to the beginning of the StringIO buffer
-    buffer.seek(0)
-
-    # Get the PDF data from the buffer
-    pdf_data = buffer.getvalue()
-    buffer.close()
-    print("PDF has been generated successfully!")
-    return pdf_data
-
 # Function to update the Chroma database and generate a risk report
-def generate_report(project_id) -> None:
-    clear_database()  # Clear the existing Chroma database
-    update_chroma(project_id)  # Update the Chroma database with new project data
-    generate_risk_report(project_id)  # Generate the risk report for the project
+# Blocking, run it in a background job; on_token receives the answer of the model while it is generated
+# and on_progress receives the name of the current step
+# use_cache=False asks the model again instead of reusing the cached answers to the same questions and context
+def generate_report(project_id, on_token=None, on_progress=None, use_cache=True) -> None:
+    if on_progress:
+        on_progress('Indexing documents')
+    update_chroma(project_id)  # Bring the project's Chroma collection up to date with its documents
+    generate_risk_report(project_id, on_token, on_progress, use_cache)  # Generate the risk report for the project
 
 # Function to get the current date in a specific format
 def get_current_date():
@@ -104,6 +88,7 @@ def get_current_date():
 
 # Function to extract text from PDF files in a given directory
 def extract_text_from_pdf(data_path):
+    import PyPDF2
     text = ""
 
     data_dir = os.listdir(data_path)
@@ -117,10 +102,109 @@ def extract_text_from_pdf(data_path):
                 text += page.extract_text()
     return text
 
-# Function to generate a risk report PDF and add it to the database
-def generate_risk_report(project_id):
+# Function to generate a risk report and add its risks to the database, it is rendered when it is viewed or downloaded
+# The sections are generated concurrently, so the report takes about as long as its slowest section
+def generate_risk_report(project_id, on_token=None, on_progress=None, use_cache=True):
     current_date = get_current_date()  # Get the current date
-    report_name = "Risk Report " + current_date + ".pdf"  # Create the report name
+    report_name = "Risk Report " + current_date  # Create the report name, the format adds the extension
+
+    if on_progress:
+        on_progress('Generating risks')
+    # Sections run at the same time, so every risk is written to on_token as a whole line once it is parsed
+    output_lock = threading.Lock()
+    done = 0
+
+    def on_risk(title, risk):
+        if on_token:
+            with output_lock:
+                on_token(f"{title}: {risk['Risk Name']} ({risk['Probability']})\n")
+
+    def on_section_done(title, succeeded):
+        nonlocal done
+        with output_lock:
+            done += 1
+            if on_token and not succeeded:
+                on_token(f"{title}: this section could not be generated\n")
+            if on_progress:
+                on_progress(f'Generating risks ({done}/{len(REPORT_SECTIONS)} sections done)')
+
+    futures = {section_executor.submit(generate_section, project_id, section, on_risk, on_section_done, use_cache): index
+               for index, section in enumerate(REPORT_SECTIONS)}
+    results = [None] * len(REPORT_SECTIONS)
+    for future in as_completed(futures):
+        results[futures[future]] = future.result()
+
+    if all(risks is None for risks in results):
+        raise RuntimeError("No section of the risk report could be generated")
+    sections = [(section["title"], risks) for section, risks in zip(REPORT_SECTIONS, results)]
+    print(sections)
+    if on_progress:
+        on_progress('Saving report')
+    save_report(report_name, project_id, current_date, sections)  # Add the sections and their risks to the database
+
+# Function to generate one section of the risk report, returns its risks or None if every attempt failed
+# on_risk receives each risk as soon as it is parsed, in JSON mode while the model is still answering
+# A failed attempt (an error or an answer without parsable risks) retries only this section,
+# risks parsed before an error are kept, with the one the answer stopped in repaired
+def generate_section(project_id, section, on_risk=None, on_done=None, use_cache=True):
+    title = section["title"]
+    json_output = REPORT_OUTPUT_FORMAT == "json"
+    question = 'Please write a list of ' + section["topic"] + (risk_json_question() if json_output else risk_question())
+    for attempt in range(1 + REPORT_SECTION_RETRIES):
+        parser = RiskStreamParser()
+        risks = []
+        sources = []  # IDs of the chunks retrieved for the question, the risks are based on them
+
+        def on_context(results):
+            sources[:] = [doc.metadata.get("id") for doc, _score in results]
+
+        def add_risks(new_risks):
+            for risk in new_risks:
+                risk["Sources"] = sources
+                risks.append(risk)
+                if on_risk:
+                    on_risk(title, risk)
+
+        def on_token(token):
+            if json_output:
+                add_risks(parser.feed(token))
+
+        response = ""
+        try:
+            # A retry asks the model again, the cached answer is the one that failed
+            response = enter_question(project_id, question, on_token, use_cache=use_cache and attempt == 0,
+                                      json_output=json_output, on_context=on_context, **section["retrieval"])
+        except Exception as e:
+            print(f"Section {title} failed (attempt {attempt + 1}): {e}")
+        add_risks(parser.close())
+        if not risks:
+            add_risks(parse_risks(response))
+        if risks:
+            if on_done:
+                on_done(title, True)
+            return risks
+        print(f"Section {title} returned no risks (attempt {attempt + 1})")
+    if on_done:
+        on_done(title, False)
+    return None
+
+# Function to get the part of a question that asks for the risks as JSON
+def risk_json_question():
+    return (" with following risk attributes: name, description (impact from this risk), probability in % (0-100), "
+            "context (why are you write this risk) and mitigation (risk mitigation way). "
+            "Answer with a JSON object matching this JSON schema and nothing else:\n"
+            + json.dumps(RISK_SCHEMA, indent=2) + "\n"
+            "Example:\n"
+            + json.dumps({"risks": [{
+                "name": "Model Accuracy",
+                "description": "Inaccurate estimation of Functional Points (FPA) and Configuration Points (CPA) due to inadequacies or errors in the LLM model.",
+                "probability": 20,
+                "context": "The success of this project heavily relies on the accuracy of the developed NLP model for FPA and CPA estimation.",
+                "mitigation": "Implement rigorous testing methodologies, including cross-validation techniques, to ensure model accuracy.",
+            }]}, indent=2))
+
+# Function to get the part of a question that asks for the risk attributes and format
+def risk_question():
     risk_attributes = " with following risk attributes (Risk Name, Risk Description (impact from this risk), Probability in %(0-100), Context explanation (why are you write this risk), Risk mitigation way) "
     risks_format = """
     Please provide a list of project risks in the following format: 
@@ -139,16 +223,15 @@ def generate_risk_report(project_id):
     - Context Explanation: The success of this project heavily relies on the accuracy of the developed NLP model for FPA and CPA estimation. 
     - Risk Mitigation Way: Implement rigorous testing methodologies, including cross-validation techniques, to ensure model accuracy. 
     """
-
-    general_risks = enter_question('Please write a list of risks' + risk_attributes + 'based on given context ONLY from project charter, NOT from meeting minutes' + risks_format)
-    risks = parse_risks(general_risks)  # Parse the general risks into a structured format
-    print(risks)
-    pdf_data = create_risk_report(risks, current_date)  # Create the risk report PDF using the list of risk details
-    add_report(report_name, pdf_data, project_id)  # Add the generated PDF report to the database
-    clear_database()  # Clear the Chroma database
-    ui.navigate.reload()  # Reload the UI
-
-# Function to enter a question and get a response from the RAG model
-def enter_question(question):
-    response = query_rag(question)
+    return risk_attributes + risks_format
+
+# Function to enter a question and get a response from the RAG model, streaming its tokens to on_token
+def enter_question(project_id, question, on_token=None, use_cache=True, json_output=False, on_context=None,
+                   **retrieval_options):
+    tokens = []
+    for token in query_rag_stream(question, project_id, use_cache, json_output, on_context, **retrieval_options):
+        tokens.append(token)  # Collect the tokens in a list instead of concatenating strings
+        if on_token:
+            on_token(token)
+    response = "".join(tokens)
     return response
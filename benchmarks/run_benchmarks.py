@@ -0,0 +1,227 @@
+# End-to-end benchmark of the report pipeline: ingest -> index -> retrieve -> generate -> report -> render
+# Runs against a stub of the Ollama API on synthetic corpora, in a temporary work directory, and writes the
+# throughput and latency percentiles of every stage to a JSON file, so runs can be compared.
+#
+# Example: python benchmarks/run_benchmarks.py --documents 10 100 1000 --output benchmark_results.json
+import argparse
+import contextlib
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+# The application modules live in the repository root
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from stub_ollama import StubOllama
+from synthetic_corpus import write_corpus, write_pdf, page_text
+
+# Questions asked by the retrieval and generation stages
+QUERIES = [
+    "What are the schedule risks of the project?",
+    "Which budget problems were discussed?",
+    "What technical issues block the integration?",
+    "Which action items are still open?",
+    "Who owns the security review?",
+    "What changed in the project scope?",
+    "Which vendors are late with deliveries?",
+    "What does the charter say about quality?",
+]
+
+# Function to get a percentile of latency samples, by the nearest-rank method
+def percentile(samples: list[float], p: float) -> float:
+    ordered = sorted(samples)
+    return ordered[max(0, min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1))]
+
+# Function to summarize the samples of a stage, items is the amount of work done in unit
+def summarize(samples: list[float], items: int, unit: str) -> dict:
+    total = sum(samples)
+    return {
+        "samples": len(samples),
+        "items": items,
+        "unit": unit,
+        "total_s": round(total, 6),
+        "throughput_per_s": round(items / total, 3) if total else None,
+        "mean_ms": round(total / len(samples) * 1000, 3),
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p95_ms": round(percentile(samples, 95) * 1000, 3),
+        "max_ms": round(max(samples) * 1000, 3),
+    }
+
+# Function to time a call, returns (seconds, result); the application's output is hidden unless verbose
+def timed(verbose: bool, function, *args, **kwargs):
+    with contextlib.ExitStack() as stack:
+        if not verbose:
+            stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, "w"))))
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        return time.perf_counter() - start, result
+
+# Function to benchmark every stage on a project of the given number of documents
+def run_size(documents: int, args, stub: StubOllama) -> dict:
+    # Imported here, after the work directory and the stub are set up
+    from data_access import execute, fetch_one, fetch_all
+    from blob_store import put_blob
+    from db import ingest_files
+    from chroma_db import update_chroma
+    from query_data import retrieve, query_rag_stream
+    from AI import generate_report
+    from reports import get_rendered_report, REPORT_FORMATS
+
+    verbose = args.verbose
+    requests_before = dict(stub.requests)
+    project_id = execute('INSERT INTO projects (title, project_manager) VALUES (?, ?)',
+                         (f'Benchmark {documents} documents', 'Benchmark'))
+    print(f"Project {project_id}: {documents} documents of {args.pages} pages")
+    stages = {}
+
+    # Synthetic corpus, not part of the pipeline but reported for reference
+    seconds, paths = timed(verbose, write_corpus, os.path.join('corpus', str(project_id)), documents, args.pages,
+                           args.words, args.seed)
+    stages['corpus'] = summarize([seconds], documents, 'documents')
+
+    # Ingest: every document on its own, as an upload
+    samples = []
+    for path in paths:
+        seconds, _ = timed(verbose, ingest_files, [path], project_id)
+        samples.append(seconds)
+    stages['ingest'] = summarize(samples, documents, 'documents')
+
+    # Index: the whole project, then again with nothing to do
+    seconds, _ = timed(verbose, update_chroma, project_id)
+    stages['index_full'] = summarize([seconds], documents * args.pages, 'pages')
+    samples = [timed(verbose, update_chroma, project_id)[0] for _ in range(args.repeats)]
+    stages['index_noop'] = summarize(samples, len(samples), 'updates')
+
+    # Incremental index: replace the content of a document and update the project
+    samples = []
+    document_ids = fetch_all('SELECT id FROM documents WHERE project_id=? ORDER BY id LIMIT ?', (project_id, args.repeats))
+    for i, (document_id, ) in enumerate(document_ids):
+        path = os.path.join('corpus', str(project_id), f'changed-{i}.pdf')
+        rng = random.Random(args.seed + 1000 + i)
+        write_pdf(path, [page_text(rng, args.words) for _ in range(args.pages)])
+        with open(path, 'rb') as file:
+            content_hash, size = put_blob(file.read())
+        execute('UPDATE documents SET content_hash=?, size=? WHERE id=?', (content_hash, size, document_id))
+        seconds, _ = timed(verbose, update_chroma, project_id)
+        samples.append(seconds)
+    if samples:
+        stages['index_incremental'] = summarize(samples, len(samples), 'documents')
+
+    # Retrieve: every query once with empty caches, then again from the caches
+    queries = [QUERIES[n % len(QUERIES)] + (f" ({n // len(QUERIES)})" if n >= len(QUERIES) else "")
+               for n in range(args.queries)]
+    for stage in ('retrieve_cold', 'retrieve_warm'):
+        samples = [timed(verbose, retrieve, query, project_id)[0] for query in queries]
+        stages[stage] = summarize(samples, len(samples), 'queries')
+
+    # Generate: a RAG answer from the model, the time to its first token, and the answer from the response cache
+    def stream(query, use_cache):
+        start = time.perf_counter()
+        first = None
+        for _token in query_rag_stream(query, project_id, use_cache):
+            if first is None:
+                first = time.perf_counter() - start
+        return first
+
+    first_token, total, cached = [], [], []
+    for query in queries[:args.repeats]:
+        seconds, first = timed(verbose, stream, query, False)
+        total.append(seconds)
+        first_token.append(first)
+        cached.append(timed(verbose, stream, query, True)[0])
+    stages['generate'] = summarize(total, len(total), 'answers')
+    stages['generate_first_token'] = summarize(first_token, len(first_token), 'answers')
+    stages['generate_cached'] = summarize(cached, len(cached), 'answers')
+
+    # Report: the whole report job, then rendering each report in every format for the first time
+    report_samples = []
+    report_ids = []
+    for _ in range(args.reports):
+        seconds, _ = timed(verbose, generate_report, project_id, None, None, False)
+        report_samples.append(seconds)
+        report_ids.append(fetch_one('SELECT MAX(id) FROM reports WHERE project_id=?', (project_id,))[0])
+    stages['report'] = summarize(report_samples, len(report_samples), 'reports')
+    for format in REPORT_FORMATS:
+        samples = [timed(verbose, get_rendered_report, report_id, format)[0] for report_id in report_ids]
+        stages[f'render_{format}'] = summarize(samples, len(samples), 'reports')
+
+    return {
+        "documents": documents,
+        "pages": documents * args.pages,
+        "stub_requests": {kind: count - requests_before[kind] for kind, count in stub.requests.items()},
+        "stages": stages,
+    }
+
+# Function to print the stages of a run as a table
+def print_stages(result: dict) -> None:
+    print(f"\n{result['documents']} documents ({result['pages']} pages)")
+    # Columns are separated by two spaces, so a value wider than its column still stays apart from the next one
+    print(f"{'stage':<22}  {'samples':>7}  {'throughput':>24}  {'p50 ms':>10}  {'p95 ms':>10}")
+    for name, stage in result["stages"].items():
+        throughput = f"{stage['throughput_per_s']} {stage['unit']}/s" if stage['throughput_per_s'] else "-"
+        print(f"{name:<22}  {stage['samples']:>7}  {throughput:>24}  {stage['p50_ms']:>10}  {stage['p95_ms']:>10}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the report pipeline against a stub of Ollama.")
+    parser.add_argument("--documents", type=int, nargs="+", default=[10], help="Corpus sizes, one project each.")
+    parser.add_argument("--pages", type=int, default=3, help="Pages per document.")
+    parser.add_argument("--words", type=int, default=300, help="Words per page.")
+    parser.add_argument("--queries", type=int, default=20, help="Queries of the retrieval stages.")
+    parser.add_argument("--repeats", type=int, default=5, help="Samples of the index and generate stages.")
+    parser.add_argument("--reports", type=int, default=3, help="Reports generated per corpus.")
+    parser.add_argument("--embed-latency", type=float, default=0.02, help="Seconds per embedding request.")
+    parser.add_argument("--generate-latency", type=float, default=0.2, help="Seconds before the first token.")
+    parser.add_argument("--token-latency", type=float, default=0.005, help="Seconds between tokens.")
+    parser.add_argument("--dimensions", type=int, default=384, help="Dimensions of the stub embeddings.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic corpora.")
+    parser.add_argument("--output", default="benchmark_results.json", help="File the results are written to.")
+    parser.add_argument("--workdir", help="Directory for the databases and corpora, a temporary one by default.")
+    parser.add_argument("--keep", action="store_true", help="Keep the work directory after the run.")
+    parser.add_argument("--verbose", action="store_true", help="Show the output of the application.")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output)
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="benchmark-"))
+    os.makedirs(workdir, exist_ok=True)
+    # The application's paths (db/, chroma/) are relative, so they now point into the work directory
+    os.chdir(workdir)
+
+    stub = StubOllama(args.embed_latency, args.generate_latency, args.token_latency, args.dimensions).start()
+    os.environ["OLLAMA_HOST"] = stub.url
+    os.environ["ANONYMIZED_TELEMETRY"] = "False"  # No telemetry requests from Chroma during the run
+    try:
+        from migrations import migrate
+        migrate()
+        results = []
+        for documents in args.documents:
+            result = run_size(documents, args, stub)
+            print_stages(result)
+            results.append(result)
+    finally:
+        stub.stop()
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(output, "w") as file:
+        json.dump({
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "environment": {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+            },
+            "config": {name: value for name, value in vars(args).items() if name not in ("output", "workdir", "keep", "verbose")},
+            "results": results,
+        }, file, indent=2)
+    print(f"\nResults written to {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+# Stub of the Ollama HTTP API for benchmarks: embeddings and generation with configurable latency
+# Embeddings are derived from a hash of the text, answers are canned risks, so runs are repeatable
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Canned risks used to answer every generate request
+RISKS = [
+    ("Schedule Delay", "Milestones slip because tasks depend on late deliveries.", 40,
+     "The minutes mention several postponed deliveries.", "Track dependencies weekly and add buffers."),
+    ("Budget Overrun", "Costs exceed the approved budget.", 30,
+     "The charter lists a fixed budget with little contingency.", "Review spending monthly against the plan."),
+    ("Key Staff Loss", "Knowledge is lost when a team member leaves.", 20,
+     "Few people know the core components.", "Document the components and pair on critical work."),
+    ("Integration Failure", "External systems do not work together as expected.", 35,
+     "Several interfaces are still unspecified.", "Agree interface contracts early and test them."),
+    ("Scope Creep", "New requirements keep being added.", 45,
+     "Stakeholders requested changes in every meeting.", "Route every change through change control."),
+]
+
+class StubOllama:
+    """Ollama-compatible HTTP server on localhost, started in a background thread."""
+
+    def __init__(self, embed_latency: float = 0.02, generate_latency: float = 0.2, token_latency: float = 0.005,
+                 dimensions: int = 384, risks: int = 5) -> None:
+        self.embed_latency = embed_latency        # Seconds per embedding request
+        self.generate_latency = generate_latency  # Seconds before the first token
+        self.token_latency = token_latency        # Seconds between tokens
+        self.dimensions = dimensions
+        self.risks = risks
+        self.requests = {"embed": 0, "generate": 0}
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubOllama":
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    # Function to get the embedding of a text, a unit vector seeded by its hash
+    def embed(self, text: str) -> list[float]:
+        rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+        vector = [rng.gauss(0.0, 1.0) for _ in range(self.dimensions)]
+        norm = math.sqrt(sum(value * value for value in vector))
+        return [value / norm for value in vector]
+
+    # Function to get the answer to a prompt, JSON risks or the "Risk N:" layout, split into tokens
+    def answer(self, json_output: bool) -> list[str]:
+        risks = [RISKS[i % len(RISKS)] for i in range(self.risks)]
+        if json_output:
+            text = json.dumps({"risks": [
+                {"name": name, "description": description, "probability": probability,
+                 "context": context, "mitigation": mitigation}
+                for name, description, probability, context, mitigation in risks]}, indent=2)
+        else:
+            text = "\n".join(
+                f"Risk {i}:\n- Risk Name: {name}\n- Risk Description: {description}\n- Probability: {probability}%\n"
+                f"- Context Explanation: {context}\n- Risk Mitigation Way: {mitigation}"
+                for i, (name, description, probability, context, mitigation) in enumerate(risks, start=1))
+        # About one token per word, keeping the whitespace
+        tokens = []
+        for word in text.split(" "):
+            tokens.append(word + " ")
+        tokens[-1] = tokens[-1][:-1]
+        return tokens
+
+    def _count(self, kind: str) -> None:
+        with self.lock:
+            self.requests[kind] += 1
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep-alive, like Ollama
+
+            def log_message(self, format, *args):
+                pass  # Keep the benchmark output readable
+
+            def _send_json(self, data, status: int = 200) -> None:
+                body = json.dumps(data).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path == "/api/tags":
+                    self._send_json({"models": []})
+                else:
+                    self._send_json({"status": "Ollama is running"})
+
+            def do_HEAD(self):
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                request = json.loads(self.rfile.read(length) or b"{}")
+                if self.path == "/api/embed":
+                    # Current API: a batch of inputs
+                    stub._count("embed")
+                    inputs = request.get("input", [])
+                    if isinstance(inputs, str):
+                        inputs = [inputs]
+                    time.sleep(stub.embed_latency)
+                    self._send_json({"model": request.get("model"), "embeddings": [stub.embed(text) for text in inputs]})
+                elif self.path == "/api/embeddings":
+                    # Older API: a single prompt
+                    stub._count("embed")
+                    time.sleep(stub.embed_latency)
+                    self._send_json({"embedding": stub.embed(request.get("prompt", ""))})
+                elif self.path == "/api/generate":
+                    stub._count("generate")
+                    self._generate(request)
+                elif self.path == "/api/show":
+                    self._send_json({"modelfile": "", "parameters": "", "template": "", "details": {}})
+                else:
+                    self._send_json({"error": f"unknown endpoint {self.path}"}, status=404)
+
+            def _generate(self, request) -> None:
+                model = request.get("model")
+                tokens = stub.answer(request.get("format") == "json")
+                time.sleep(stub.generate_latency)
+                parts = [{"response": token, "done": False} for token in tokens]
+                parts.append({"response": "", "done": True, "done_reason": "stop", "eval_count": len(tokens)})
+                if request.get("stream", True) is False:
+                    self._send_json({"model": model, "created_at": now(), "response": "".join(tokens),
+                                     "done": True, "done_reason": "stop", "eval_count": len(tokens)})
+                    return
+                # Streamed as newline-delimited JSON with chunked transfer encoding, like Ollama
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for i, part in enumerate(parts):
+                    if i:
+                        time.sleep(stub.token_latency)
+                    line = json.dumps({"model": model, "created_at": now(), **part}).encode("utf-8") + b"\n"
+                    self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+
+        return Handler
+
+# Function to get the current time in the format of Ollama's created_at
+def now() -> str:
+    return datetime.now(timezone.utc).isoformat()
@@ -0,0 +1,53 @@
+# Synthetic project corpora for benchmarks: a charter, meeting minutes and status reports as PDF files
+import os
+import random
+from datetime import date, timedelta
+
+# Words the page texts are made of, with enough project vocabulary for retrieval to have something to rank
+VOCABULARY = (
+    "project schedule milestone deadline delay budget cost funding resource team staff vendor contract "
+    "requirement scope change risk issue mitigation quality test release integration interface system "
+    "database server migration security compliance stakeholder sponsor approval review meeting action "
+    "item owner decision plan estimate effort delivery customer feedback training documentation support "
+    "the a of to and in for on with by from is are was will be should must may this that next week month"
+).split()
+
+# Function to get the file name of the n-th document of a corpus, named like real project documents,
+# so classification and date parsing of the indexer see the usual document types and dates
+def document_name(n: int, start: date = date(2024, 1, 1)) -> str:
+    if n == 0:
+        return "Project Charter.pdf"
+    day = start + timedelta(days=7 * n)
+    if n % 5 == 0:
+        return f"Status Report {day.isoformat()} {n}.pdf"
+    return f"Meeting Minutes {day.day} {day.strftime('%B')} {day.year} {n}.pdf"
+
+# Function to make up the text of a page
+def page_text(rng: random.Random, words: int) -> str:
+    sentences = []
+    while words > 0:
+        length = min(words, rng.randint(8, 20))
+        sentence = " ".join(rng.choice(VOCABULARY) for _ in range(length))
+        sentences.append(sentence.capitalize() + ".")
+        words -= length
+    return " ".join(sentences)
+
+# Function to write a PDF with the given page texts
+def write_pdf(path: str, texts: list[str]) -> None:
+    import fitz  # PyMuPDF
+    with fitz.open() as pdf_document:
+        for text in texts:
+            page = pdf_document.new_page()
+            page.insert_textbox(page.rect + (54, 54, -54, -54), text, fontsize=10)
+        pdf_document.save(path)
+
+# Function to write a corpus of documents to a directory, returns the paths of the files
+def write_corpus(directory: str, documents: int, pages: int, words: int, seed: int = 0) -> list[str]:
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+    for n in range(documents):
+        path = os.path.join(directory, document_name(n))
+        write_pdf(path, [page_text(rng, words) for _ in range(pages)])
+        paths.append(path)
+    return paths
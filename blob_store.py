@@ -0,0 +1,57 @@
+# Import necessary libraries and modules
+import hashlib
+import os
+import tempfile
+from constants import BLOBS_PATH
+
+# Size of the pieces files are copied and hashed in
+CHUNK_SIZE = 1024 * 1024
+
+# Function to get the path of a blob on disk from its SHA-256 hash
+def blob_path(content_hash: str) -> str:
+    return os.path.join(BLOBS_PATH, content_hash[:2], content_hash)
+
+# Function to store bytes in the blob store, returns their hash and size
+def put_blob(data: bytes):
+    content_hash = hashlib.sha256(data).hexdigest()
+    path = blob_path(content_hash)
+    if not os.path.exists(path):  # Identical content is stored only once
+        write_atomically(path, [data])
+    return content_hash, len(data)
+
+# Function to store the contents of a file object in the blob store without reading it into memory at once
+def put_blob_stream(fileobj):
+    os.makedirs(BLOBS_PATH, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    # Copy into a temporary file while hashing, the final name is only known at the end
+    with tempfile.NamedTemporaryFile(dir=BLOBS_PATH, delete=False) as temp_file:
+        while chunk := fileobj.read(CHUNK_SIZE):
+            digest.update(chunk)
+            temp_file.write(chunk)
+            size += len(chunk)
+    content_hash = digest.hexdigest()
+    path = blob_path(content_hash)
+    if os.path.exists(path):
+        os.remove(temp_file.name)  # Identical content is stored only once
+    else:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(temp_file.name, path)
+    return content_hash, size
+
+# Function to write a blob through a temporary file, so readers never see a half-written blob
+def write_atomically(path: str, chunks) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), delete=False) as temp_file:
+        for chunk in chunks:
+            temp_file.write(chunk)
+    os.replace(temp_file.name, path)
+
+# Function to open a blob for streamed reading
+def open_blob(content_hash: str):
+    return open(blob_path(content_hash), 'rb')
+
+# Function to read a whole blob, only for small files
+def read_blob(content_hash: str) -> bytes:
+    with open_blob(content_hash) as f:
+        return f.read()
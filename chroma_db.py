@@ -1,58 +1,273 @@
 # Import necessary libraries and modules
-import sqlite3
 import os
+import json
+import hashlib
 import shutil
-import fitz  # PyMuPDF
-from langchain_community.vectorstores import Chroma
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+import threading
+import re
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing.context import SpawnContext, SpawnProcess
 from langchain_core.documents.base import Document
-from get_embedding_function import get_embedding_function
-from constants import DB_PATH, CHROMA_PATH
+from clients import get_vector_store, forget_vector_store
+from blob_store import blob_path
+from data_access import transaction, fetch_one, fetch_all
+from constants import CHROMA_PATH, EXTRACTION_WORKERS, EXTRACTION_PAGES_PER_TASK, EXTRACTION_PROCESS_NAME
+
+# Process pool for PDF text extraction, created on first use
+extraction_executor = None
+extraction_executor_lock = threading.Lock()
+
+class ExtractionProcess(SpawnProcess):
+    """Spawned worker of the extraction pool, named so main.py can tell it apart and not start the app in it."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.name = f"{EXTRACTION_PROCESS_NAME}-{self.name.rsplit('-', 1)[-1]}"
+
+class ExtractionContext(SpawnContext):
+    """Spawn start method that creates ExtractionProcess workers."""
+
+    Process = ExtractionProcess
+
+# Locks that let only one update of a project's index run at a time
+project_locks = {}
+project_locks_lock = threading.Lock()
+
+# Function to get the persistent Chroma collection of a project
+# The collection is opened once through the shared Chroma client and reused by every caller
+def get_chroma(project_id):
+    return get_vector_store(project_id)
 
 # Function to update the Chroma database
+# Updates of the same project run one after another, e.g. an index job after an upload and a report
 def update_chroma(project_id):
-    documents = load_documents(project_id)  # Load documents from the database
-    chunks = split_documents(documents)     # Split the documents into chunks
-    add_to_chroma(chunks)                   # Add the chunks to the Chroma database
+    with project_locks_lock:
+        lock = project_locks.setdefault(str(project_id), threading.Lock())
+    with lock:
+        # Collections created before they were searched by cosine distance are rebuilt once
+        if (get_chroma(project_id)._collection.metadata or {}).get("hnsw:space") != "cosine":
+            clear_database(project_id)
+        index_project(project_id)
+
+# Function to bring the Chroma collection of a project up to date with its documents
+def index_project(project_id):
+    # Content hashes of the documents currently attached to the project
+    current = dict(fetch_all('SELECT id, content_hash FROM documents WHERE project_id=?', (project_id, )))
+
+    # Content hashes and chunk IDs of the documents that are already indexed
+    rows = fetch_all('SELECT document_id, content_hash, chunk_ids FROM indexed_documents WHERE project_id=?', (project_id, ))
+    indexed = {document_id: (content_hash, json.loads(chunk_ids))
+               for document_id, content_hash, chunk_ids in rows}
+
+    # Only new or changed documents have to be extracted
+    changed_ids = [document_id for document_id, content_hash in current.items()
+                   if document_id not in indexed or indexed[document_id][0] != content_hash]
+    # Removed documents only have to lose their chunks
+    removed_ids = [document_id for document_id in indexed if document_id not in current]
+
+    if not changed_ids and not removed_ids:
+        print("✅ Index is up to date")
+        return
+
+    db = get_chroma(project_id)  # Open the project's own collection
+    changed = False  # Whether chunks were deleted from or added to the collection
+
+    # Delete the chunks of removed documents
+    stale_ids = [chunk_id for document_id in removed_ids for chunk_id in indexed[document_id][1]]
+    if stale_ids:
+        print(f"🗑️ Removing stale chunks: {len(stale_ids)}")
+        db.delete(ids=stale_ids)
+        changed = True
+
+    # Split and embed every new or changed document as soon as its pages are extracted, while the
+    # process pool works on the others; documents that fail to extract keep their old chunks and are retried
+    chunk_ids = {}  # New chunk IDs of every extracted document, so they can be deleted when it changes
+    for pages in load_documents(project_id, changed_ids):
+        document_id = pages[0].metadata["document_id"]
+        chunks = calculate_chunk_ids(split_documents(pages))  # Split the pages into chunks with stable IDs
+        chunk_ids[document_id] = [chunk.metadata["id"] for chunk in chunks]
+
+        # Chunk IDs derive from page and content, so only chunks of edited pages differ from the indexed ones
+        old_ids = set(indexed[document_id][1]) if document_id in indexed else set()
+        new_ids = set(chunk_ids[document_id])
+        stale_ids = [chunk_id for chunk_id in old_ids if chunk_id not in new_ids]
+        new_chunks = [chunk for chunk in chunks if chunk.metadata["id"] not in old_ids]
+
+        # Delete the chunks of edited pages and add those of new and edited pages
+        if stale_ids:
+            print(f"🗑️ Removing stale chunks: {len(stale_ids)}")
+            db.delete(ids=stale_ids)
+        if new_chunks:
+            add_to_chroma(db, new_chunks)
+        changed = changed or bool(stale_ids or new_chunks)
+
+    # Nothing was extracted or removed, e.g. only documents that fail to extract are left: the index is unchanged
+    if not chunk_ids and not removed_ids:
+        print("✅ No new documents to add")
+        return
+
+    # Record what is indexed now, so the next update only touches documents that change
+    with transaction() as conn:
+        conn.executemany('DELETE FROM indexed_documents WHERE document_id=?',
+                         [(document_id, ) for document_id in removed_ids])
+        conn.executemany(
+            'INSERT OR REPLACE INTO indexed_documents (document_id, project_id, content_hash, chunk_ids) VALUES (?, ?, ?, ?)',
+            [(document_id, project_id, current[document_id], json.dumps(chunk_ids[document_id]))
+             for document_id in chunk_ids])
+        # Only a collection that changed invalidates the cached retrieval results of the project
+        if changed:
+            bump_index_version(conn, project_id)
+
+# Function to get the version of a project's index, it changes every time the collection changes
+def get_index_version(project_id):
+    row = fetch_one('SELECT version FROM index_versions WHERE project_id=?', (project_id, ))
+    if row:
+        return row[0]
+    return 0
+
+# Function to increase the version of a project's index, inside the caller's transaction
+def bump_index_version(conn, project_id):
+    conn.execute('''
+    INSERT INTO index_versions (project_id, version) VALUES (?, 1)
+    ON CONFLICT (project_id) DO UPDATE SET version = version + 1
+    ''', (project_id, ))
+
+# Function to get the process pool for PDF text extraction
+def get_extraction_executor():
+    global extraction_executor
+    # Index and report jobs may ask for the pool at the same time, only one of them creates it
+    with extraction_executor_lock:
+        if extraction_executor is None:
+            # Spawned workers start clean, forking would copy the server's threads and open connections
+            extraction_executor = ProcessPoolExecutor(max_workers=EXTRACTION_WORKERS, mp_context=ExtractionContext())
+        return extraction_executor
 
 # Function to load documents from the SQLite database
-def load_documents(project_id):
-    conn = sqlite3.connect(DB_PATH)  # Connect to the SQLite database
-    cursor = conn.cursor()
-    
-    # Select the name and data (PDF content) of documents for the given project ID
-    cursor.execute('SELECT name, data FROM documents WHERE project_id=?', (project_id, ))
-    rows = cursor.fetchall()
-    
-    documents = []
-    for row in rows:
-        name, content = row
+# Text is extracted in a process pool and the pages of each document are yielded together, as a list with
+# one Document per page, as soon as all of them are extracted
+def load_documents(project_id, document_ids):
+    if not document_ids:
+        return
+
+    # Select the name and content hash of the requested documents for the given project ID
+    placeholders = ", ".join("?" for _ in document_ids)
+    rows = fetch_all(f'SELECT id, name, content_hash FROM documents WHERE project_id=? AND id IN ({placeholders})',
+                     (project_id, *document_ids))
+
+    # Submit one extraction task per range of EXTRACTION_PAGES_PER_TASK pages
+    executor = get_extraction_executor()
+    futures = {}
+    pending = {}  # Documents whose page ranges are still being extracted
+    for document_id, name, content_hash in rows:
+        # Workers open the PDF from the blob store themselves, only its path is sent to them
+        pdf_path = blob_path(content_hash)
         try:
-            # Extract text from the PDF content
-            content_str = extract_text_from_pdf(content)
+            page_count, creation_date = read_pdf_info(pdf_path)
         except Exception as e:
-            # Print an error message if text extraction fails
+            # Print an error message if the PDF cannot be opened
             print(f"Error extracting text from PDF for document {name}: {e}")
             continue
-        
-        # Create a Document object with the extracted text and metadata
-        document = Document(page_content=content_str, metadata={"source": name})
-        documents.append(document)
-    
-    conn.close()  # Close the database connection
-    return documents
-
-# Function to extract text from a PDF blob
-def extract_text_from_pdf(pdf_blob):
-    pdf_document = fitz.open(stream=pdf_blob, filetype="pdf")  # Open the PDF from the blob
-    text = ""
-    for page_num in range(len(pdf_document)):
-        page = pdf_document.load_page(page_num)  # Load each page of the PDF
-        text += page.get_text()                  # Extract text from the page
-    return text
+
+        page_ranges = [(first_page, min(first_page + EXTRACTION_PAGES_PER_TASK, page_count))
+                       for first_page in range(0, page_count, EXTRACTION_PAGES_PER_TASK)]
+        if not page_ranges:
+            continue
+        pending[document_id] = {"name": name, "parts": [None] * len(page_ranges), "remaining": len(page_ranges),
+                                "metadata": document_metadata(project_id, document_id, name, creation_date)}
+        for index, (first_page, last_page) in enumerate(page_ranges):
+            futures[executor.submit(extract_text_from_pdf, pdf_path, first_page, last_page)] = (document_id, index)
+
+    # Collect the page ranges in the order they finish
+    for future in as_completed(futures):
+        document_id, index = futures[future]
+        document = pending.get(document_id)
+        if document is None:
+            continue  # Another page range of the document already failed
+
+        try:
+            document["parts"][index] = future.result()
+        except Exception as e:
+            # Print an error message if text extraction fails
+            print(f"Error extracting text from PDF for document {document['name']}: {e}")
+            del pending[document_id]
+            continue
+
+        document["remaining"] -= 1
+        if document["remaining"] == 0:
+            del pending[document_id]
+            # Create a Document object with the extracted text and metadata for every page
+            page_texts = [page_text for part in document["parts"] for page_text in part]
+            yield [Document(page_content=page_text, metadata={**document["metadata"], "page": page_num})
+                   for page_num, page_text in enumerate(page_texts, start=1)]
+
+# Function to build the metadata every chunk of a document is tagged with, so queries can filter on it
+def document_metadata(project_id, document_id, name, creation_date=None):
+    metadata = {
+        "source": name,
+        "document_id": document_id,
+        "project_id": int(project_id),
+        "doc_type": classify_document(name),
+    }
+    # Date of the document as a YYYYMMDD number, Chroma compares only numbers with $gte and $lte
+    doc_date = parse_document_date(name) or creation_date
+    if doc_date:
+        metadata["doc_date"] = int(doc_date.strftime("%Y%m%d"))
+    return metadata
+
+# Function to guess the type of a document from its file name: charter, minutes, report or other
+def classify_document(name):
+    name = name.lower()
+    if "charter" in name:
+        return "charter"
+    if "minutes" in name or "meeting" in name:
+        return "minutes"
+    if "report" in name:
+        return "report"
+    return "other"
+
+# Date formats found in document names, e.g. "Meeting Minutes 16 May 2024" or "Meeting Minutes April 18 2024"
+DATE_PATTERNS = [
+    (re.compile(r"\d{4}-\d{2}-\d{2}"), "%Y-%m-%d"),
+    (re.compile(r"\d{1,2} [A-Za-z]+ \d{4}"), "%d %B %Y"),
+    (re.compile(r"[A-Za-z]+ \d{1,2} \d{4}"), "%B %d %Y"),
+]
+
+# Function to find the date of a document in its file name
+def parse_document_date(name):
+    for pattern, date_format in DATE_PATTERNS:
+        for match in pattern.finditer(name):
+            try:
+                return datetime.strptime(match.group(), date_format)
+            except ValueError:
+                continue  # e.g. "Minutes 16 2024" matched a pattern but is not a date
+    return None
+
+# Function to read the page count and creation date of a PDF file
+def read_pdf_info(pdf_path):
+    import fitz  # PyMuPDF, imported on first use of the indexer
+    with fitz.open(pdf_path, filetype="pdf") as pdf_document:
+        creation_date = None
+        # PDF dates look like "D:20240516093000+02'00'"
+        match = re.match(r"D:(\d{8})", pdf_document.metadata.get("creationDate") or "")
+        if match:
+            try:
+                creation_date = datetime.strptime(match.group(1), "%Y%m%d")
+            except ValueError:
+                pass
+        return pdf_document.page_count, creation_date
+
+# Function to extract the text of each page in a range of pages of a PDF file, runs in a worker process
+def extract_text_from_pdf(pdf_path, first_page=0, last_page=None):
+    import fitz  # PyMuPDF, imported on first use of the indexer
+    with fitz.open(pdf_path, filetype="pdf") as pdf_document:  # Open the PDF from the blob store
+        if last_page is None:
+            last_page = pdf_document.page_count
+        return [pdf_document.load_page(page_num).get_text() for page_num in range(first_page, last_page)]
 
 # Function to split documents into smaller chunks
-def split_documents(documents: list[Document]):
+def split_documents(documents):
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=800,          # Define the chunk size
         chunk_overlap=80,        # Define the overlap between chunks
@@ -61,62 +276,46 @@ def split_documents(documents: list[Document]):
     )
     return text_splitter.split_documents(documents)  # Split the documents and return chunks
 
-# Function to add document chunks to the Chroma database
-def add_to_chroma(chunks: list[Document]):
-    db = Chroma(
-        persist_directory=CHROMA_PATH,  # Define the directory to persist the database
-        embedding_function=get_embedding_function()  # Use a function to get embeddings
-    )
-
-    chunks_with_ids = calculate_chunk_ids(chunks)  # Calculate unique IDs for each chunk
-
-    existing_items = db.get(include=[])  # Get existing items from the Chroma database
-    existing_ids = set(existing_items["ids"])  # Extract existing IDs
-    print(f"Number of existing documents in DB: {len(existing_ids)}")
-
-    new_chunks = []
-    for chunk in chunks_with_ids:
-        if chunk.metadata["id"] not in existing_ids:
-            new_chunks.append(chunk)  # Add new chunks that are not already in the database
-
-    if len(new_chunks):
-        print(f"👉 Adding new documents: {len(new_chunks)}")
-        new_chunk_ids = [chunk.metadata["id"] for chunk in new_chunks]
-        db.add_documents(new_chunks, ids=new_chunk_ids)  # Add new chunks to the database
-        db.persist()  # Persist the changes
+# Function to add document chunks, which already have IDs, to the Chroma database
+def add_to_chroma(db, chunks: list[Document]):
+    if len(chunks):
+        print(f"👉 Adding new documents: {len(chunks)}")
+        new_chunk_ids = [chunk.metadata["id"] for chunk in chunks]
+        db.add_documents(chunks, ids=new_chunk_ids)  # Add new chunks, the persistent client writes them to disk
     else:
         print("✅ No new documents to add")
 
-    db.delete_collection()  # Close the Chroma database connection
-
 # Function to calculate unique IDs for each chunk
+# IDs look like "document_id:page:content_hash", so editing one page does not change the IDs of the others
 def calculate_chunk_ids(chunks):
-    last_page_id = None
-    current_chunk_index = 0
+    seen_ids = {}
 
     for chunk in chunks:
-        source = chunk.metadata.get("source")
+        document_id = chunk.metadata.get("document_id")  # Document IDs stay unique when file names repeat
         page = chunk.metadata.get("page", 1)  # Default to page 1 if not available
-        current_page_id = f"{source}:{page}"
-
-        if current_page_id == last_page_id:
-            current_chunk_index += 1
-        else:
-            current_chunk_index = 0
+        content_hash = hashlib.sha256(chunk.page_content.encode()).hexdigest()[:16]
+        chunk_id = f"{document_id}:{page}:{content_hash}"
 
-        chunk_id = f"{current_page_id}:{current_chunk_index}"
-        last_page_id = current_page_id
+        # Number repeated chunks with the same text on the same page
+        count = seen_ids.get(chunk_id, 0)
+        seen_ids[chunk_id] = count + 1
+        if count:
+            chunk_id = f"{chunk_id}:{count}"
 
         chunk.metadata["id"] = chunk_id
 
     return chunks
 
-# Function to clear the Chroma database
-def clear_database():
+# Function to clear the Chroma collection of a project, so the next update rebuilds it from scratch
+def clear_database(project_id):
     try:
         if os.path.exists(CHROMA_PATH):
-            # Remove the Chroma database directory
-            # shutil.rmtree(CHROMA_PATH)
+            # Remove the project's collection and forget what was indexed for it
+            get_chroma(project_id).delete_collection()
+            forget_vector_store(project_id)  # The next get_chroma creates the collection again
+            with transaction() as conn:
+                conn.execute('DELETE FROM indexed_documents WHERE project_id=?', (project_id, ))
+                bump_index_version(conn, project_id)
             print("Database cleared successfully.")
         else:
             print("Database path does not exist.")
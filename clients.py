@@ -0,0 +1,68 @@
+# Import necessary libraries and modules
+import threading
+from constants import CHROMA_PATH, OLLAMA_MODEL, OLLAMA_KEEP_ALIVE, LLM_OPTIONS
+
+# Process-wide registry of long-lived clients, each one created on first use and shared by every module.
+# The Ollama clients keep their HTTP connections open between calls, and the Chroma client keeps the
+# persistent database open, so a query does not pay for setting them up again.
+# Their libraries are imported together with the clients, on first use.
+clients = {}
+vector_stores = {}  # Chroma wrappers of the project collections, by project ID
+clients_lock = threading.Lock()
+
+# Function to get a client from the registry, creating it with create on first use
+def get_client(name: str, create):
+    client = clients.get(name)
+    if client is None:
+        with clients_lock:
+            client = clients.get(name)
+            if client is None:
+                client = clients[name] = create()
+    return client
+
+# Function to get the shared embedding function
+def get_embeddings():
+    from get_embedding_function import get_embedding_function
+    return get_client("embeddings", get_embedding_function)
+
+# Function to get the shared language model, json_output=True gets the one that may only answer with JSON
+def get_llm(json_output: bool = False):
+    from langchain_ollama import OllamaLLM
+    name = "llm_json" if json_output else "llm"
+    # The parameters include the model name, the same ones key the response cache
+    return get_client(name, lambda: OllamaLLM(keep_alive=OLLAMA_KEEP_ALIVE, **get_llm_params(json_output)))
+
+# Function to get the model name and generation parameters of the shared language model
+def get_llm_params(json_output: bool = False) -> dict:
+    params = {"model": OLLAMA_MODEL, **LLM_OPTIONS}
+    if json_output:
+        params["format"] = "json"  # Ollama constrains the answer to valid JSON
+    return params
+
+# Function to get the shared Chroma client of the persistent database
+def get_chroma_client():
+    import chromadb
+    return get_client("chroma", lambda: chromadb.PersistentClient(path=CHROMA_PATH))
+
+# Function to get the shared Chroma wrapper of a project's collection
+def get_vector_store(project_id):
+    key = str(project_id)
+    with clients_lock:
+        db = vector_stores.get(key)
+    if db is None:
+        from langchain_community.vectorstores import Chroma
+        db = Chroma(
+            client=get_chroma_client(),
+            collection_name=f"project_{project_id}",  # One collection per project keeps indexes apart
+            embedding_function=get_embeddings(),
+            # Searched by cosine distance, the same measure min_score and the re-ranker use
+            collection_metadata={"hnsw:space": "cosine"}
+        )
+        with clients_lock:
+            db = vector_stores.setdefault(key, db)
+    return db
+
+# Function to forget the wrapper of a project's collection, e.g. after the collection was deleted
+def forget_vector_store(project_id) -> None:
+    with clients_lock:
+        vector_stores.pop(str(project_id), None)
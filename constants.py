@@ -1,3 +1,53 @@
+import os
+
 DB_PATH = 'db/main_db.db'
 FILES_PATH = 'files'
-CHROMA_PATH = "chroma"
\ No newline at end of file
+CHROMA_PATH = "chroma"
+BLOBS_PATH = 'db/blobs'  # Content-addressed store of uploaded documents and generated reports
+
+# SQLite connection pool settings
+DB_POOL_SIZE = 8        # Connections open at the same time per database file
+DB_BUSY_TIMEOUT = 10.0  # Seconds a statement waits for a lock before "database is locked"
+
+# Ollama model settings
+OLLAMA_MODEL = "mistral"   # Model used for embeddings and answers
+OLLAMA_KEEP_ALIVE = 1800  # Seconds Ollama keeps the model loaded after a request (the embeddings client only takes an int)
+LLM_OPTIONS = {}           # Generation parameters of the model, e.g. {"temperature": 0.2}
+
+# Embedding pipeline settings
+EMBEDDING_BATCH_SIZE = 16   # Chunks sent to the embedding server per batch
+EMBEDDING_MAX_WORKERS = 4   # Batches embedded at the same time
+EMBEDDING_MAX_RETRIES = 3   # Retries of a failed batch before giving up
+EMBEDDING_CACHE_PATH = 'db/embedding_cache.db'
+EMBEDDING_CACHE_MAX_ENTRIES = 20000  # About 16 KB per cached mistral embedding
+CACHE_TOUCH_INTERVAL = 60  # Seconds before a hit records the last use of a disk cache entry again
+
+# Retrieval settings
+QUERY_CACHE_SIZE = 256  # Query embeddings and search results kept in memory
+RETRIEVAL_K = 5                # Chunks used as context of a prompt
+RETRIEVAL_MODE = "mmr"         # "similarity" or "mmr" (maximal marginal relevance, skips near-duplicate chunks)
+RETRIEVAL_FETCH_K = 20         # Candidates fetched for MMR, score threshold and re-ranking
+RETRIEVAL_MMR_LAMBDA = 0.5     # 1 favours relevance only, 0 favours diversity only
+RETRIEVAL_RERANK_WEIGHT = 0.3  # Weight of the query term overlap in the re-ranking score
+CONTEXT_TOKEN_BUDGET = 2000    # Estimated tokens of context packed into a prompt
+
+# Model answer cache settings
+RESPONSE_CACHE_PATH = 'db/response_cache.db'
+RESPONSE_CACHE_MAX_ENTRIES = 2000
+
+# PDF text extraction settings
+EXTRACTION_WORKERS = os.cpu_count()  # Processes extracting text at the same time
+EXTRACTION_PAGES_PER_TASK = 25       # Pages of one PDF extracted by a single task
+EXTRACTION_PROCESS_NAME = "ExtractionWorker"  # Name prefix of the extraction processes, main.py does not start the app in them
+
+# PDF viewer settings
+VIEWER_ZOOM = 1.5             # Zoom of the page shown in the viewer
+VIEWER_THUMBNAIL_ZOOM = 0.2   # Zoom of the page thumbnails
+VIEWER_CACHE_BYTES = 64 * 1024 * 1024  # Rendered pages kept in memory
+
+# Background report generation settings
+REPORT_WORKERS = 2     # Reports generated at the same time
+REPORT_JOB_TTL = 3600  # Seconds a finished job is kept for the pages polling it
+REPORT_SECTION_WORKERS = 3  # Sections of one report generated at the same time
+REPORT_SECTION_RETRIES = 2  # Extra attempts of a section that failed
+REPORT_OUTPUT_FORMAT = "json"  # "json" asks the model for structured risks, "text" for the "Risk N:" layout
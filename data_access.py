@@ -0,0 +1,103 @@
+# Import necessary libraries and modules
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from constants import DB_PATH, DB_POOL_SIZE, DB_BUSY_TIMEOUT
+
+class ConnectionPool:
+    """Thread-safe pool of SQLite connections in WAL mode.
+
+    Connections run in autocommit mode; use transaction() to group statements,
+    it commits on success and rolls back on any exception.
+    """
+
+    def __init__(self, path: str, size: int = DB_POOL_SIZE, busy_timeout: float = DB_BUSY_TIMEOUT) -> None:
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)  # SQLite creates the file, not its directory
+        self.busy_timeout = busy_timeout
+        self.idle = queue.LifoQueue(maxsize=size)  # Reuse the most recently used connection first
+        self.slots = threading.BoundedSemaphore(size)  # At most size connections are open at once
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout,  # Wait for locks instead of failing with "database is locked"
+            check_same_thread=False,    # Connections move between threads through the pool
+            isolation_level=None,       # Transactions are opened explicitly by transaction()
+            cached_statements=256,      # Prepared statements are reused by every user of the connection
+        )
+        conn.execute('PRAGMA journal_mode=WAL')    # Readers no longer block the writer and vice versa
+        conn.execute('PRAGMA synchronous=NORMAL')  # Safe in WAL mode and saves an fsync per commit
+        return conn
+
+    @contextmanager
+    def connection(self):
+        self.slots.acquire()
+        try:
+            try:
+                conn = self.idle.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+            try:
+                yield conn
+            finally:
+                if conn.in_transaction:
+                    conn.rollback()  # Never hand out a connection with a transaction left open
+                self.idle.put_nowait(conn)
+        finally:
+            self.slots.release()
+
+    @contextmanager
+    def transaction(self):
+        with self.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')  # Take the write lock up front, so the transaction cannot deadlock later
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    # Function to close every idle connection, e.g. before the database file is deleted
+    def close(self) -> None:
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+# Pools of every SQLite database used by the application, keyed by path
+pools = {}
+pools_lock = threading.Lock()
+
+# Function to get the connection pool of a database, created on first use
+def get_pool(path: str = DB_PATH) -> ConnectionPool:
+    with pools_lock:
+        if path not in pools:
+            pools[path] = ConnectionPool(path)
+        return pools[path]
+
+# Function to borrow a connection to the main database
+def connection():
+    return get_pool().connection()
+
+# Function to run statements on the main database in one transaction
+def transaction():
+    return get_pool().transaction()
+
+# Function to fetch a single row from the main database
+def fetch_one(sql: str, params=()):
+    with connection() as conn:
+        return conn.execute(sql, params).fetchone()
+
+# Function to fetch all rows from the main database
+def fetch_all(sql: str, params=()):
+    with connection() as conn:
+        return conn.execute(sql, params).fetchall()
+
+# Function to run a single statement on the main database in its own transaction
+def execute(sql: str, params=()):
+    with transaction() as conn:
+        return conn.execute(sql, params).lastrowid
@@ -1,260 +1,160 @@
 # ------------------- IMPORTS -------------------
 
-from nicegui import ui
-import sqlite3
-import fitz  # PyMuPDF
-from PIL import Image
-import io
-import matplotlib.pyplot as plt
-from matplotlib.widgets import Button
+from nicegui import ui, run
 from local_file_picker import local_file_picker
 import os
 from typing import Optional
 from constants import DB_PATH, FILES_PATH
-import base64
-
-# Initialize the database with necessary tables
+from blob_store import put_blob, put_blob_stream
+from pdf_viewer import show_pdf
+from reports import REPORT_FORMATS
+from data_access import get_pool, transaction, execute, fetch_one, fetch_all
+from migrations import migrate
+
+# Initialize the database: open the existing one and apply the schema migrations it has not had yet
+# Data is kept, a new database starts empty and is filled once by seed_db.py
 def initialize_db():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    # Create reports table
-    c.execute('''
-    CREATE TABLE IF NOT EXISTS reports (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL,
-        data BLOB NOT NULL,
-        project_id INTEGER NOT NULL,
-        FOREIGN KEY (project_id) REFERENCES projects(id)
-    )
-    ''')
-
-    # Create documents table
-    c.execute('''
-    CREATE TABLE IF NOT EXISTS documents (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL,
-        data BLOB NOT NULL,
-        project_id INTEGER NOT NULL,
-        FOREIGN KEY (project_id) REFERENCES projects(id)
-    )
-    ''')
-    
-    # Create users table
-    c.execute('''
-    CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL,
-        username TEXT NOT NULL,
-        password TEXT NOT NULL
-    )
-    ''')
-    
-    # Create projects table
-    c.execute('''
-    CREATE TABLE IF NOT EXISTS projects (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        title TEXT NOT NULL,
-        start_date DATE,
-        end_date DATE,
-        project_manager TEXT
-    )
-    ''')
-
-    # Create user_projects bridge table
-    c.execute('''
-    CREATE TABLE IF NOT EXISTS user_projects (
-        user_id INTEGER NOT NULL,
-        project_id INTEGER NOT NULL,
-        FOREIGN KEY (user_id) REFERENCES users(id),
-        FOREIGN KEY (project_id) REFERENCES projects(id),
-        PRIMARY KEY (user_id, project_id)
-    )
-    ''')
-
-    conn.commit()
-    conn.close()
+    version = migrate()
+    print(f"Database schema is at version {version}")
+    if not fetch_one('SELECT 1 FROM users LIMIT 1'):
+        print("The database has no users yet, run 'python seed_db.py' once to add the sample data")
 
 # Function to upload PDF files from a folder to the database
 def upload_files_from_folder(folder_path, project_id):
-    for filename in os.listdir(folder_path):
-        if filename.endswith('.pdf'):  # Check if the file is a PDF
-            file_path = os.path.join(folder_path, filename)
-            with open(file_path, 'rb') as file:
-                file_data = file.read()
-                add_file(filename, file_data, project_id)
-
-# Function to populate the database with sample data
+    file_paths = [os.path.join(folder_path, filename) for filename in sorted(os.listdir(folder_path))
+                  if filename.endswith('.pdf')]  # Check if the file is a PDF
+    return ingest_files(file_paths, project_id)
+
+# Function to add many files to a project at once
+# Each file is streamed into the blob store, and all rows are inserted in a single transaction.
+# Returns the names of the added files and of the files that were rejected because they are not PDFs.
+def ingest_files(file_paths, project_id):
+    rows = []
+    rejected = []
+    for file_path in file_paths:
+        name = os.path.basename(file_path)
+        with open(file_path, 'rb') as file:
+            # Check the PDF signature instead of trusting the file extension
+            if file.read(5) != b'%PDF-':
+                print(f"Skipping {name}: not a PDF file")
+                rejected.append(name)
+                continue
+            file.seek(0)
+            content_hash, size = put_blob_stream(file)
+        rows.append((name, content_hash, size, project_id))
+
+    with transaction() as conn:
+        conn.executemany('''
+        INSERT INTO documents (name, content_hash, size, project_id)
+        VALUES (?, ?, ?, ?)
+        ''', rows)
+    print(f"Added {len(rows)} files to project {project_id}")
+    return [row[0] for row in rows], rejected
+
+# Function to populate the database with sample data, only once: returns False if it already has users
 def fill_db():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+    with transaction() as conn:
+        c = conn.cursor()
+        if c.execute('SELECT 1 FROM users LIMIT 1').fetchone():
+            print("The database is already seeded.")
+            return False
     
-    # Insert sample users
-    c.execute('''
-    INSERT INTO users (name, username, password)
-    VALUES (?, ?, ?)
-    ''', ('Oleksandr', 'admin', 'admin'))
-    c.execute('''
-    INSERT INTO users (name, username, password)
-    VALUES (?, ?, ?)
-    ''', ('User', 'user', 'user'))
+        # Insert sample users
+        c.execute('''
+        INSERT INTO users (name, username, password)
+        VALUES (?, ?, ?)
+        ''', ('Oleksandr', 'admin', 'admin'))
+        c.execute('''
+        INSERT INTO users (name, username, password)
+        VALUES (?, ?, ?)
+        ''', ('User', 'user', 'user'))
     
-    # Insert sample projects
-    c.execute('''
-    INSERT INTO projects (title, start_date, end_date, project_manager)
-    VALUES (?, ?, ?, ?)
-    ''', ('TEST Project 1', '2022-01-01', '2023-01-01', 'Oleksandr Kovalchuk'))
-    c.execute('''
-    INSERT INTO projects (title, start_date, end_date, project_manager)
-    VALUES (?, ?, ?, ?)
-    ''', ('TEST Project 2', '2023-01-01', '2025-01-01', 'Oleksandr Kovalchuk'))
+        # Insert sample projects
+        c.execute('''
+        INSERT INTO projects (title, start_date, end_date, project_manager)
+        VALUES (?, ?, ?, ?)
+        ''', ('TEST Project 1', '2022-01-01', '2023-01-01', 'Oleksandr Kovalchuk'))
+        c.execute('''
+        INSERT INTO projects (title, start_date, end_date, project_manager)
+        VALUES (?, ?, ?, ?)
+        ''', ('TEST Project 2', '2023-01-01', '2025-01-01', 'Oleksandr Kovalchuk'))
     
-    # Assign users to projects
-    c.execute('''
-    INSERT INTO user_projects (user_id, project_id)
-    VALUES (?, ?)
-    ''', ('1', '1'))
-    c.execute('''
-    INSERT INTO user_projects (user_id, project_id)
-    VALUES (?, ?)
-    ''', ('1', '2'))
-    
-    conn.commit()
+        # Assign users to projects
+        c.execute('''
+        INSERT INTO user_projects (user_id, project_id)
+        VALUES (?, ?)
+        ''', ('1', '1'))
+        c.execute('''
+        INSERT INTO user_projects (user_id, project_id)
+        VALUES (?, ?)
+        ''', ('1', '2'))
     upload_files_from_folder(FILES_PATH, 1)
-    conn.close()
+    return True
 
 # Function to delete the database file
 def delete_database_file():
+    get_pool().close()  # Close pooled connections first, the file cannot be removed while they are open
     if os.path.exists(DB_PATH):
         os.remove(DB_PATH)
+        # Remove the write-ahead log files of WAL mode as well
+        for suffix in ('-wal', '-shm'):
+            if os.path.exists(DB_PATH + suffix):
+                os.remove(DB_PATH + suffix)
         print("Database file deleted.")
     else:
         print("Database file not found.")
 
 # Function to add a file to the database
 def add_file(name, data, project_id):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('''
-    INSERT INTO documents (name, data, project_id)
-    VALUES (?, ?, ?)
-    ''', (name, data, project_id))
-    print((name, project_id))
-    conn.commit()
-    conn.close()
-
-# Function to add a report to the database
-def add_report(name, data, project_id):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('''
-    INSERT INTO reports (name, data, project_id)
-    VALUES (?, ?, ?)
-    ''', (name, data, project_id))
+    # The content goes to the blob store, the row only keeps its hash and size
+    content_hash, size = put_blob(data)
+    execute('''
+    INSERT INTO documents (name, content_hash, size, project_id)
+    VALUES (?, ?, ?, ?)
+    ''', (name, content_hash, size, project_id))
     print((name, project_id))
-    conn.commit()
-    conn.close()
 
-# Function to display a PDF file
-def display_pdf(file_id, type):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    if type == "document":
-        c.execute('SELECT name, data FROM documents WHERE id=?', (file_id,))
-    if type == "report":
-        c.execute('SELECT name, data FROM reports WHERE id=?', (file_id,))
-    row = c.fetchone()
-    conn.close()
-
-    if row is None:
+# Function to display a PDF file in the browser viewer
+async def display_pdf(file_id, type):
+    filename, content_hash, size = get_file_info(file_id, type)
+    if filename is None:
         ui.notify("File not found!")
         return
 
-    filename, file_data = row
-    with open('temp.pdf', 'wb') as f:
-        f.write(file_data)
-
-    doc = fitz.open('temp.pdf')
-    fig, ax = plt.subplots(figsize=(20, 12))
-    plt.subplots_adjust(bottom=0.2)
-    
-    page_num = 0
-    total_pages = doc.page_count
-
-    def show_page(num):
-        ax.clear()
-        page = doc.load_page(num)
-        pix = page.get_pixmap()
-        img_data = pix.tobytes(output='png')
-        img = Image.open(io.BytesIO(img_data))
-        ax.imshow(img)
-        ax.set_title(f"{filename} - Page {num + 1}/{total_pages}")
-        ax.axis('off')
-        plt.draw()
-
-    def next_page(event):
-        nonlocal page_num
-        if page_num < total_pages - 1:
-            page_num += 1
-            show_page(page_num)
-
-    def prev_page(event):
-        nonlocal page_num
-        if page_num > 0:
-            page_num -= 1
-            show_page(page_num)
-
-    axprev = plt.axes([0.1, 0.05, 0.1, 0.075])
-    axnext = plt.axes([0.8, 0.05, 0.1, 0.075])
-    
-    bnext = Button(axnext, 'Next')
-    bprev = Button(axprev, 'Previous')
-    
-    bnext.on_clicked(next_page)
-    bprev.on_clicked(prev_page)
-    
-    show_page(page_num)
-    # Maximize the plt window
-    manager = plt.get_current_fig_manager()
-    manager.resize(*manager.window.maxsize())
-    plt.show()
+    # Pages are rendered on demand by the viewer route, straight from the blob store
+    await show_pdf(filename, content_hash)
 
 # Function to pick and upload files for a specific project
-async def pick_file(project_id) -> None:
+# on_ingested is called after the files are stored, e.g. to start indexing them in the background
+async def pick_file(project_id, on_ingested=None) -> None:
     file_path = await local_file_picker('~', multiple=True)
     print(project_id)
     if file_path:
-        for file in file_path:
-            with open(file, 'rb') as f:
-                file_data = f.read()
-            add_file(os.path.basename(file), file_data, project_id)
-        ui.notify(f'You added {len(file_path)} files.')
+        # Store the files off the event loop, they can be large and many
+        added, rejected = await run.io_bound(ingest_files, file_path, project_id)
+        ui.notify(f'You added {len(added)} files.')
+        if rejected:
+            ui.notify(f'Skipped {len(rejected)} files that are not PDFs: {", ".join(rejected)}', color='warning')
+        if added and on_ingested:
+            on_ingested()
         ui.navigate.reload()
 
-# Function to get file data from the database by file ID
-def get_file_data(file_id, type):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+# Function to get the name, content hash and size of a file by file ID
+def get_file_info(file_id, type):
+    file = None
     if type == "document":
-        c.execute('SELECT name, data FROM documents WHERE id=?', (file_id,))
+        file = fetch_one('SELECT name, content_hash, size FROM documents WHERE id=?', (file_id,))
     if type == "report":
-        c.execute('SELECT name, data FROM reports WHERE id=?', (file_id,))
-    file = c.fetchone()
-    conn.close()
+        file = fetch_one('SELECT name, content_hash, size FROM reports WHERE id=?', (file_id,))
     if file:
-        filename, file_data = file
-        return filename, file_data
-    return None, None
+        return file
+    return None, None, None
 
 # Function to view documents for a specific project
 def view_documents(project_id):
     print(project_id)
     print('View')
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('SELECT id, name FROM documents WHERE project_id=?', (project_id, ))
-    files = c.fetchall()
-    conn.close()
+    files = fetch_all('SELECT id, name FROM documents WHERE project_id=?', (project_id, ))
     
     with ui.dialog() as dialog, ui.card():
         ui.label('Documents:')
@@ -269,89 +169,78 @@ def view_documents(project_id):
         ui.button('Close', on_click=dialog.close)
     dialog.open()
 
-# Function to handle file download by file ID
-def download_file(file_id, type):
-    filename, file_data = get_file_data(file_id, type)
-    if file_data:
-        encoded_file_data = base64.b64encode(file_data).decode('utf-8')
-        ui.download(f'data:application/octet-stream;base64,{encoded_file_data}', filename)
+# Function to handle file download by file ID, format picks the format a report is rendered in
+# The browser fetches the file from the download route, which streams it from the blob store
+def download_file(file_id, type, format=None):
+    url = f'/download/{type}/{file_id}'
+    if format:
+        url += f'?format={format}'
+    ui.download(url)
+
+# Function to show a report in the page, as the HTML page the download route renders and caches
+def show_report(report_id):
+    with ui.dialog().props('maximized') as dialog, ui.card().classes('w-full h-full'):
+        ui.element('iframe').props(f'src="/download/report/{report_id}?format=html&inline=true"').classes('w-full grow')
+        ui.button('Close', on_click=dialog.close)
+    dialog.open()
 
 # Function to view reports for a specific project
 def view_reports(project_id):
     print(project_id)
     print('View')
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('SELECT id, name FROM reports WHERE project_id=?', (project_id,))
-    files = c.fetchall()
-    conn.close()
+    files = fetch_all('SELECT id, name, content_hash FROM reports WHERE project_id=?', (project_id,))
     
     with ui.dialog() as dialog, ui.card():
         ui.label('Reports:')
         if files:
             for file in files:
-                file_id, filename = file
+                file_id, filename, content_hash = file
                 with ui.row():
-                    # Button to view the PDF
-                    ui.button(filename, on_click=lambda file_id=file_id: display_pdf(file_id, "report"))
-                    # Button to download the file
-                    ui.button('', on_click=lambda file_id=file_id: download_file(file_id, "report"), icon='download')
+                    if content_hash:
+                        # A report from before risks were stored, only its PDF exists
+                        ui.button(filename, on_click=lambda file_id=file_id: display_pdf(file_id, "report"))
+                        ui.button('', on_click=lambda file_id=file_id: download_file(file_id, "report"), icon='download')
+                        continue
+                    # Button to view the report, rendered from its risks
+                    ui.button(filename, on_click=lambda file_id=file_id: show_report(file_id))
+                    # Buttons to download the report in each format, the PDF is only built when it is downloaded
+                    with ui.dropdown_button(icon='download', auto_close=True):
+                        for format in REPORT_FORMATS:
+                            ui.item(format.upper(), on_click=lambda file_id=file_id, format=format: download_file(file_id, "report", format))
         ui.button('Close', on_click=dialog.close)
     
     dialog.open()
 
 # Function to get user ID based on username and password
 def get_user_id(username: str, password: str) -> Optional[str]:
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('SELECT id FROM users WHERE username=? AND password=?', (username, password))
-    row = c.fetchone()
-    conn.close()
+    row = fetch_one('SELECT id FROM users WHERE username=? AND password=?', (username, password))
     if row:
         return row[0]
     return None
 
 # Function to get current user data based on user ID
 def get_current_user_data(user_id: str) -> Optional[str]:
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('SELECT name FROM users WHERE id=?', (user_id,))
-    row = c.fetchone()
-    conn.close()
+    row = fetch_one('SELECT name FROM users WHERE id=?', (user_id,))
     if row:
         return row[0]
     return None
 
-# Function to get projects associated with a user ID
-def get_projects(user_id: str) -> Optional[str]:
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('SELECT project_id FROM user_projects WHERE user_id=?', (user_id,))
-    row = c.fetchall()
-    conn.close()
-    if row:
-        return row
-    return None
-
-# Function to get project data based on project ID
-def get_project_data(project_id: str) -> Optional[str]:
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('SELECT title, start_date, end_date, project_manager FROM projects WHERE id=?', (project_id,))
-    row = c.fetchone()
-    conn.close()
-    if row:
-        return row
-    return None
-
-# Function to get documents associated with a project ID
-def get_project_documents(project_id: str) -> Optional[str]:
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('SELECT id FROM documents WHERE project_id=?', (project_id,))
-    row = c.fetchall()
-    conn.close()
-    if row:
-        result = [item[0] for item in row]
-        return result
-    return []
+# Query of project summaries: project data with document and report counts, counted through the project_id indexes
+PROJECT_SUMMARY_QUERY = '''
+SELECT p.id, p.title, p.start_date, p.end_date, p.project_manager,
+       (SELECT COUNT(*) FROM documents d WHERE d.project_id = p.id) AS documents_count,
+       (SELECT COUNT(*) FROM reports r WHERE r.project_id = p.id) AS reports_count
+FROM projects p
+'''
+
+# Function to get the summaries of all projects associated with a user ID in one query
+def get_project_summaries(user_id: str) -> list:
+    return fetch_all(PROJECT_SUMMARY_QUERY + '''
+    JOIN user_projects up ON up.project_id = p.id
+    WHERE up.user_id=?
+    ORDER BY p.id
+    ''', (user_id,))
+
+# Function to get the summary of a project based on project ID
+def get_project_summary(project_id: str) -> Optional[tuple]:
+    return fetch_one(PROJECT_SUMMARY_QUERY + 'WHERE p.id=?', (project_id,))
@@ -0,0 +1,77 @@
+# Import necessary libraries and modules
+import threading
+import time
+from data_access import get_pool
+from constants import CACHE_TOUCH_INTERVAL
+
+class DiskCache:
+    """Size-bounded key/value cache stored in SQLite, evicting the least recently used entries."""
+
+    def __init__(self, path: str, max_entries: int, touch_interval: float = CACHE_TOUCH_INTERVAL) -> None:
+        self.max_entries = max_entries
+        self.touch_interval = touch_interval  # Seconds before a hit updates the last use of an entry again
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()  # Guards the counters
+        self.pool = get_pool(path)
+        with self.pool.transaction() as conn:
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                last_used REAL NOT NULL
+            )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS cache_last_used ON cache (last_used)')
+
+    # Function to look up several keys at once, returns the values that were found
+    def get_many(self, keys: list[str]) -> dict[str, bytes]:
+        found = {}
+        touched = []  # Found keys whose recorded last use is older than touch_interval
+        now = time.time()
+        # Plain reads without the write lock, in WAL mode lookups run alongside each other and the writer
+        with self.pool.connection() as conn:
+            for i in range(0, len(keys), 500):  # Stay below SQLite's host parameter limit
+                batch = keys[i:i + 500]
+                placeholders = ", ".join("?" for _ in batch)
+                rows = conn.execute(f'SELECT key, value, last_used FROM cache WHERE key IN ({placeholders})', batch)
+                for key, value, last_used in rows:
+                    found[key] = value
+                    if now - last_used >= self.touch_interval:
+                        touched.append(key)
+        # Mark the found entries as recently used in a short write, skipped while their last use is recent
+        if touched:
+            with self.pool.transaction() as conn:
+                conn.executemany('UPDATE cache SET last_used=? WHERE key=?', [(now, key) for key in touched])
+        with self.lock:
+            self.hits += len(found)
+            self.misses += len(set(keys)) - len(found)
+        return found
+
+    # Function to look up a single key, returns None on a miss
+    def get(self, key: str):
+        return self.get_many([key]).get(key)
+
+    # Function to store several values at once and evict the oldest entries above the size limit
+    def set_many(self, items: dict[str, bytes]) -> None:
+        now = time.time()
+        with self.pool.transaction() as conn:
+            conn.executemany('INSERT OR REPLACE INTO cache (key, value, last_used) VALUES (?, ?, ?)',
+                             [(key, value, now) for key, value in items.items()])
+            count = conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+            if count > self.max_entries:
+                conn.execute('DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY last_used LIMIT ?)',
+                             (count - self.max_entries, ))
+
+    # Function to store a single value
+    def set(self, key: str, value: bytes) -> None:
+        self.set_many({key: value})
+
+    # Function to get the hit/miss counters of the cache
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
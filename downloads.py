@@ -0,0 +1,83 @@
+# Import necessary libraries and modules
+import re
+from urllib.parse import quote
+from fastapi import HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+from nicegui import app, run
+from blob_store import open_blob, CHUNK_SIZE
+from db import get_file_info
+from reports import get_rendered_report, REPORT_FORMATS
+
+# Pattern of a single byte range, e.g. "bytes=0-1023", "bytes=1024-" or "bytes=-500"
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# Function to read a part of a blob in chunks, so the file is never held in memory at once
+def iter_blob(content_hash: str, start: int, length: int):
+    with open_blob(content_hash) as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+# Function to parse a Range header into (start, end) with end inclusive, None means the whole file
+def parse_range(range_header: str, size: int):
+    match = RANGE_PATTERN.match(range_header.strip())
+    if not match or match.groups() == ('', ''):
+        return None  # Multiple or malformed ranges are answered with the whole file
+    first, last = match.groups()
+    if first == '':
+        # Suffix range: the last N bytes
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        raise HTTPException(status_code=416, headers={'Content-Range': f'bytes */{size}'})
+    return start, end
+
+# Route that streams documents and reports from the blob store, with ETag and Range support
+# Reports are rendered in the requested format on first download; inline shows the file in the browser
+@app.get('/download/{type}/{file_id}')
+async def download(request: Request, type: str, file_id: int, format: str = 'pdf', inline: bool = False) -> Response:
+    if not app.storage.user.get('authenticated', False):
+        raise HTTPException(status_code=401)
+    if type == 'document':
+        filename, content_hash, size = await run.io_bound(get_file_info, file_id, type)
+        media_type = 'application/pdf'
+    elif type == 'report' and format in REPORT_FORMATS:
+        # Rendering builds the file, e.g. the PDF with ReportLab, so it runs off the event loop
+        filename, content_hash, size = await run.io_bound(get_rendered_report, file_id, format)
+        media_type = REPORT_FORMATS[format]
+    else:
+        raise HTTPException(status_code=404)
+    if filename is None:
+        raise HTTPException(status_code=404)
+
+    # The blob hash identifies the content, so it is a strong ETag
+    etag = f'"{content_hash}"'
+    headers = {
+        'ETag': etag,
+        'Accept-Ranges': 'bytes',
+        'Cache-Control': 'private, no-cache',  # The browser keeps the file and revalidates it with the ETag
+        'Content-Disposition': f"{'inline' if inline else 'attachment'}; filename*=UTF-8''{quote(filename)}",
+    }
+    if etag in request.headers.get('if-none-match', ''):
+        return Response(status_code=304, headers=headers)
+
+    # Ranges are only honoured if the browser's copy is still current
+    byte_range = None
+    if 'range' in request.headers and request.headers.get('if-range', etag) == etag:
+        byte_range = parse_range(request.headers['range'], size)
+
+    if byte_range is None:
+        headers['Content-Length'] = str(size)
+        return StreamingResponse(iter_blob(content_hash, 0, size), media_type=media_type, headers=headers)
+
+    start, end = byte_range
+    headers['Content-Length'] = str(end - start + 1)
+    headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return StreamingResponse(iter_blob(content_hash, start, end - start + 1), status_code=206,
+                             media_type=media_type, headers=headers)
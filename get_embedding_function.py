@@ -1,5 +1,81 @@
-from langchain_community.embeddings.ollama import OllamaEmbeddings
+import time
+import hashlib
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.embeddings import Embeddings
+from langchain_ollama import OllamaEmbeddings
+from disk_cache import DiskCache
+from constants import (OLLAMA_MODEL, OLLAMA_KEEP_ALIVE, EMBEDDING_BATCH_SIZE, EMBEDDING_MAX_WORKERS, EMBEDDING_MAX_RETRIES,
+                       EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES)
 
+# Bounded worker pool shared by every embedding function, so the embedding server
+# never receives more than EMBEDDING_MAX_WORKERS requests from this process at once
+embedding_executor = ThreadPoolExecutor(max_workers=EMBEDDING_MAX_WORKERS, thread_name_prefix='embedding')
+
+class BatchedEmbeddings(Embeddings):
+    """Embeds documents in batches, several batches at a time, retrying failed batches."""
+
+    def __init__(self, embeddings: Embeddings, batch_size: int = EMBEDDING_BATCH_SIZE,
+                 max_retries: int = EMBEDDING_MAX_RETRIES, executor: ThreadPoolExecutor = embedding_executor) -> None:
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.executor = executor
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        # Split the texts into batches and embed them concurrently, keeping the original order
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        results = self.executor.map(self._embed_batch, batches)
+        return [embedding for batch in results for embedding in batch]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embeddings.embed_query(text)
+
+    def _embed_batch(self, batch: list[str]) -> list[list[float]]:
+        # Retry a failed batch with exponential backoff, only this batch is sent again
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self.embeddings.embed_documents(batch)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                print(f"Embedding batch failed ({e}), retrying {attempt + 1}/{self.max_retries}")
+                time.sleep(0.5 * 2 ** attempt)
+
+class CachedEmbeddings(Embeddings):
+    """Looks up document embeddings in a disk cache keyed by chunk text and model, and embeds only the misses."""
+
+    def __init__(self, embeddings: Embeddings, model: str, cache: DiskCache) -> None:
+        self.embeddings = embeddings
+        self.model = model
+        self.cache = cache
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        keys = [self._key(text) for text in texts]
+        cached = self.cache.get_many(keys)
+
+        # Embed every missing text once, even if it occurs several times
+        missing = {key: text for key, text in zip(keys, texts) if key not in cached}
+        if missing:
+            embeddings = self.embeddings.embed_documents(list(missing.values()))
+            new_items = {key: array('f', embedding).tobytes() for key, embedding in zip(missing, embeddings)}
+            self.cache.set_many(new_items)
+            cached.update(new_items)
+
+        return [array('f', cached[key]).tolist() for key in keys]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embeddings.embed_query(text)
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model}\0{text}".encode()).hexdigest()
+
+# Disk cache shared by every embedding function of this process
+embedding_cache = DiskCache(EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES)
+
+# Function to create an embedding function, modules share one through clients.get_embeddings
 def get_embedding_function():
-    embeddings = OllamaEmbeddings(model="mistral")
+    model = OLLAMA_MODEL
+    ollama = OllamaEmbeddings(model=model, keep_alive=OLLAMA_KEEP_ALIVE)
+    embeddings = CachedEmbeddings(BatchedEmbeddings(ollama), model, embedding_cache)
     return embeddings
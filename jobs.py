@@ -0,0 +1,106 @@
+# Import necessary libraries and modules
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from constants import REPORT_WORKERS, REPORT_JOB_TTL
+
+class Job:
+    """State of a report generation or indexing run in the background."""
+
+    def __init__(self, project_id: str, kind: str) -> None:
+        self.id = uuid.uuid4().hex
+        self.project_id = project_id
+        self.kind = kind  # report or index
+        self.status = 'queued'  # queued, running, done or failed
+        self.progress = 'Waiting for a free worker'
+        self.tokens = []  # Answer of the model, appended while it is generated
+        self.error = None
+        self.finished_at = None
+
+    @property
+    def active(self) -> bool:
+        return self.status in ('queued', 'running')
+
+    @property
+    def output(self) -> str:
+        return ''.join(self.tokens)
+
+    def set_progress(self, progress: str) -> None:
+        self.progress = progress
+
+# Bounded worker pool for background jobs, and every job that is running or finished recently
+executor = ThreadPoolExecutor(max_workers=REPORT_WORKERS, thread_name_prefix='report')
+jobs = {}
+jobs_lock = threading.Lock()
+
+# Function to queue a report generation for a project, returns the job ID immediately
+# use_cache=False regenerates the report instead of reusing the cached answers of the model
+def submit_report_job(project_id, use_cache: bool = True) -> str:
+    return submit_job(project_id, 'report', lambda job: run_report_job(job, use_cache))
+
+# Function to queue indexing of a project's documents, e.g. right after they are uploaded
+def submit_index_job(project_id) -> str:
+    return submit_job(project_id, 'index', run_index_job)
+
+# Function to queue a job, a project has at most one active job of each kind
+def submit_job(project_id, kind: str, work) -> str:
+    project_id = str(project_id)
+    with jobs_lock:
+        prune_jobs()
+        # A second click joins the job that is already running
+        job = get_active_job(project_id, kind)
+        if job:
+            return job.id
+        job = Job(project_id, kind)
+        jobs[job.id] = job
+    executor.submit(run_job, job, work)
+    return job.id
+
+# Function to run a job in a worker thread
+def run_job(job: Job, work) -> None:
+    job.status = 'running'
+    try:
+        work(job)
+        job.status = 'done'
+    except Exception as e:
+        # Keep the error on the job, so the page can show it
+        print(f"Job {job.kind} for project {job.project_id} failed: {e}")
+        job.status = 'failed'
+        job.error = str(e)
+        job.progress = 'Failed'
+    finally:
+        job.finished_at = time.time()
+
+# Function to generate a risk report for the project of a job
+# The report and indexing modules, with the model and vector store libraries they load, are imported
+# by the first job that needs them instead of when the pages are imported
+def run_report_job(job: Job, use_cache: bool = True) -> None:
+    from AI import generate_report
+    generate_report(job.project_id, job.tokens.append, job.set_progress, use_cache)
+    job.progress = 'Report is ready'
+
+# Function to index the documents of the project of a job
+def run_index_job(job: Job) -> None:
+    from chroma_db import update_chroma
+    job.progress = 'Indexing documents'
+    update_chroma(job.project_id)
+    job.progress = 'Documents are indexed'
+
+# Function to get a job by its ID
+def get_job(job_id: str):
+    return jobs.get(job_id)
+
+# Function to get the queued or running job of a kind for a project
+def get_active_job(project_id, kind: str = 'report'):
+    for job in list(jobs.values()):
+        if job.project_id == str(project_id) and job.kind == kind and job.active:
+            return job
+    return None
+
+# Function to forget jobs that finished more than REPORT_JOB_TTL seconds ago
+def prune_jobs() -> None:
+    now = time.time()
+    for job_id, job in list(jobs.items()):
+        if job.finished_at and now - job.finished_at > REPORT_JOB_TTL:
+            del jobs[job_id]
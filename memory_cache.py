@@ -0,0 +1,58 @@
+# Import necessary libraries and modules
+import threading
+from collections import OrderedDict
+
+class LRUCache:
+    """Thread-safe in-memory cache that drops the least recently used entries above a fixed size.
+
+    By default every entry counts as 1 towards maxsize; pass a weigher, e.g. len,
+    to bound the cache by the total size of its values instead.
+    """
+
+    def __init__(self, maxsize: int, weigher=None) -> None:
+        self.maxsize = maxsize
+        self.weigher = weigher or (lambda value: 1)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    # Function to look up a key, returns None on a miss
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)  # Mark the entry as recently used
+            self.hits += 1
+            return self.entries[key]
+
+    # Function to store a value and evict the oldest entries above the size limit
+    def set(self, key, value) -> None:
+        with self.lock:
+            if key in self.entries:
+                self.size -= self.weigher(self.entries[key])
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            self.size += self.weigher(value)
+            while self.size > self.maxsize and self.entries:
+                _key, evicted = self.entries.popitem(last=False)
+                self.size -= self.weigher(evicted)
+
+    # Function to drop every entry whose key matches the predicate
+    def invalidate(self, predicate) -> None:
+        with self.lock:
+            for key in [key for key in self.entries if predicate(key)]:
+                self.size -= self.weigher(self.entries.pop(key))
+
+    # Function to get the hit/miss counters of the cache
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self.entries),
+            "size": self.size,
+        }
@@ -0,0 +1,203 @@
+# Import necessary libraries and modules
+import sqlite3
+from blob_store import put_blob
+from data_access import get_pool
+from constants import DB_PATH
+
+# Versioned schema of the main database.
+# Each migration upgrades the schema by one version and is never changed once released; add a new one instead.
+# The version the database is at is kept in PRAGMA user_version, 0 for a new database.
+
+# Migration 1: the original tables, with file contents stored in the rows
+def create_initial_tables(conn: sqlite3.Connection) -> None:
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS reports (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        data BLOB NOT NULL,
+        project_id INTEGER NOT NULL,
+        FOREIGN KEY (project_id) REFERENCES projects(id)
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS documents (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        data BLOB NOT NULL,
+        project_id INTEGER NOT NULL,
+        FOREIGN KEY (project_id) REFERENCES projects(id)
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        username TEXT NOT NULL,
+        password TEXT NOT NULL
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS projects (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT NOT NULL,
+        start_date DATE,
+        end_date DATE,
+        project_manager TEXT
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS user_projects (
+        user_id INTEGER NOT NULL,
+        project_id INTEGER NOT NULL,
+        FOREIGN KEY (user_id) REFERENCES users(id),
+        FOREIGN KEY (project_id) REFERENCES projects(id),
+        PRIMARY KEY (user_id, project_id)
+    )
+    ''')
+
+# Migration 2: move the contents of documents and reports into the blob store, the rows keep their hash and size
+def move_files_to_blob_store(conn: sqlite3.Connection) -> None:
+    for table in ('documents', 'reports'):
+        columns = [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+        if 'data' not in columns:
+            continue  # Already moved
+        conn.execute(f'''
+        CREATE TABLE {table}_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            content_hash TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            project_id INTEGER NOT NULL,
+            FOREIGN KEY (project_id) REFERENCES projects(id)
+        )
+        ''')
+        rows = []
+        for file_id, name, data, project_id in conn.execute(f'SELECT id, name, data, project_id FROM {table}'):
+            content_hash, size = put_blob(data)
+            rows.append((file_id, name, content_hash, size, project_id))
+        conn.executemany(f'INSERT INTO {table}_new (id, name, content_hash, size, project_id) VALUES (?, ?, ?, ?, ?)',
+                         rows)
+        conn.execute(f'DROP TABLE {table}')
+        conn.execute(f'ALTER TABLE {table}_new RENAME TO {table}')
+
+# Migration 3: bookkeeping of the Chroma index, and indexes for the per-project lookups and counts
+# (user_projects needs none, its primary key already starts with user_id)
+def create_index_tables(conn: sqlite3.Connection) -> None:
+    # Documents already embedded into Chroma
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS indexed_documents (
+        document_id INTEGER PRIMARY KEY,
+        project_id INTEGER NOT NULL,
+        content_hash TEXT NOT NULL,
+        chunk_ids TEXT NOT NULL
+    )
+    ''')
+    # Bumped whenever a project's Chroma collection changes
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS index_versions (
+        project_id INTEGER PRIMARY KEY,
+        version INTEGER NOT NULL
+    )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS documents_project_id ON documents (project_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS reports_project_id ON reports (project_id)')
+
+# Migration 4: reports keep their risks as rows and are rendered on demand, the PDF columns of reports
+# are only set for reports created before, which exist as PDF files alone
+def create_report_tables(conn: sqlite3.Connection) -> None:
+    conn.execute('''
+    CREATE TABLE reports_new (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        content_hash TEXT,
+        size INTEGER,
+        project_id INTEGER NOT NULL,
+        report_date TEXT,
+        FOREIGN KEY (project_id) REFERENCES projects(id)
+    )
+    ''')
+    conn.execute('INSERT INTO reports_new (id, name, content_hash, size, project_id) '
+                 'SELECT id, name, content_hash, size, project_id FROM reports')
+    conn.execute('DROP TABLE reports')
+    conn.execute('ALTER TABLE reports_new RENAME TO reports')
+    conn.execute('CREATE INDEX IF NOT EXISTS reports_project_id ON reports (project_id)')
+
+    # Sections of a report in order, generated is 0 for a section the model failed to answer
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS report_sections (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        report_id INTEGER NOT NULL,
+        position INTEGER NOT NULL,
+        title TEXT NOT NULL,
+        generated INTEGER NOT NULL,
+        FOREIGN KEY (report_id) REFERENCES reports(id)
+    )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS report_sections_report_id ON report_sections (report_id)')
+
+    # Risks of a section in order, sources holds the JSON list of the IDs of the chunks they are based on
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS report_risks (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        section_id INTEGER NOT NULL,
+        position INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        description TEXT NOT NULL,
+        probability TEXT NOT NULL,
+        context TEXT NOT NULL,
+        mitigation TEXT NOT NULL,
+        sources TEXT NOT NULL,
+        FOREIGN KEY (section_id) REFERENCES report_sections(id)
+    )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS report_risks_section_id ON report_risks (section_id)')
+
+    # Rendered reports in the blob store, one per report and format
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS report_renders (
+        report_id INTEGER NOT NULL,
+        format TEXT NOT NULL,
+        content_hash TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        PRIMARY KEY (report_id, format),
+        FOREIGN KEY (report_id) REFERENCES reports(id)
+    )
+    ''')
+
+# Every migration in order, as (version, description, function)
+MIGRATIONS = [
+    (1, 'Create the initial tables', create_initial_tables),
+    (2, 'Move file contents into the blob store', move_files_to_blob_store),
+    (3, 'Create the index tables', create_index_tables),
+    (4, 'Store reports as risks', create_report_tables),
+]
+
+# Function to get the schema version of a database
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+# Function to bring a database up to the latest schema version, returns the version it is at afterwards
+# Each migration runs in its own transaction together with the version update, so an interrupted upgrade
+# resumes at the first migration that did not finish; an up-to-date database is left untouched
+def migrate(path: str = DB_PATH) -> int:
+    pool = get_pool(path)
+    with pool.connection() as conn:
+        if get_schema_version(conn) >= MIGRATIONS[-1][0]:
+            return get_schema_version(conn)  # Up to date, the usual case at startup
+    applied = []
+    for version, description, upgrade in MIGRATIONS:
+        with pool.transaction() as conn:
+            if get_schema_version(conn) >= version:
+                continue  # Applied before, e.g. by another process
+            print(f"Migrating database to version {version}: {description}")
+            upgrade(conn)
+            conn.execute(f'PRAGMA user_version = {version}')
+        applied.append(version)
+    with pool.connection() as conn:
+        # Moving the file contents into the blob store leaves most pages of the database free: give them back,
+        # so the file stays small and quick to back up (VACUUM cannot run inside a transaction)
+        if 2 in applied:
+            print("Compacting the database")
+            conn.execute('VACUUM')
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')  # Write the compacted pages back to the file
+        return get_schema_version(conn)
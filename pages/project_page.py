@@ -4,34 +4,63 @@ from nicegui import ui
 # Import the message function from the styles module for displaying styled messages
 from styles.message import message
 
-# Import database-related functions: pick_file, view_documents, view_reports, get_project_data, and get_project_documents
-from db import pick_file, view_documents, view_reports, get_project_data, get_project_documents
+# Import database-related functions: pick_file, view_documents, view_reports and get_project_summary
+from db import pick_file, view_documents, view_reports, get_project_summary
 
-# Import the generate_report function from the AI module for generating reports
-from AI import generate_report
+# Import the job functions for generating reports in the background
+from jobs import submit_report_job, submit_index_job, get_job, get_active_job
+
+# Define a function that follows a report job and shows its progress and the answer of the model
+def follow_job(job_id: str, buttons: list[ui.button], progress: ui.label, output: ui.label) -> None:
+    # Disable the buttons while the job runs and show the progress labels
+    for button in buttons:
+        button.disable()
+    progress.set_visibility(True)
+    output.set_visibility(True)
+
+    def enable_buttons() -> None:
+        for button in buttons:
+            button.enable()
+
+    def poll() -> None:
+        job = get_job(job_id)
+        if job is None:
+            timer.cancel()
+            enable_buttons()
+            return
+        progress.set_text(job.progress)
+        output.set_text(job.output)
+        if job.status == 'done':
+            timer.cancel()
+            ui.notify('Risk report is ready')
+            ui.navigate.reload()  # Reload the page to show the new report
+        elif job.status == 'failed':
+            timer.cancel()
+            enable_buttons()
+            ui.notify(f'Risk report failed: {job.error}', color='negative')
+
+    # Poll the job from the event loop, the job itself runs in a worker thread
+    timer = ui.timer(0.2, poll)
 
 # Define the content function which takes a project_id as a string parameter and returns None
 def content(project_id: str) -> None:
-    # Get the project data from the database using the project_id
-    project_data = get_project_data(project_id)
-    
-    # Get the documents related to the project from the database using the project_id
-    project_documents = get_project_documents(project_id)
-    
-    # Count the number of documents related to the project
-    documents_count = len(project_documents)
+    # Get the project data and its document count from the database in one query using the project_id
+    project_data = get_project_summary(project_id)
     
     # Extract the project title from the project data
-    project_title = project_data[0]
+    project_title = project_data[1]
     
     # Extract the project start date from the project data
-    project_start_date = project_data[1]
+    project_start_date = project_data[2]
     
     # Extract the project end date from the project data
-    project_end_date = project_data[2]
+    project_end_date = project_data[3]
     
     # Extract the project manager's name from the project data
-    project_manager = project_data[3]
+    project_manager = project_data[4]
+    
+    # Extract the number of documents related to the project
+    documents_count = project_data[5]
 
     # Display a message showing the project ID
     message(f'Project  #{project_id}')
@@ -56,8 +85,8 @@ def content(project_id: str) -> None:
     
     # Create a row for horizontally arranging the buttons
     with ui.row():
-        # Add a button to "Add document", which calls pick_file with the project_id when clicked. The button has an 'add' icon, blue color, and size 20px
-        ui.button(text='Add document', on_click=lambda: pick_file(project_id), icon='add', color='blue').props("size=20px")
+        # Add a button to "Add document", which calls pick_file with the project_id when clicked and indexes the new files in the background. The button has an 'add' icon, blue color, and size 20px
+        ui.button(text='Add document', on_click=lambda: pick_file(project_id, lambda: submit_index_job(project_id)), icon='add', color='blue').props("size=20px")
         
         # Add a button to "View documents", which calls view_documents with the project_id when clicked. The button has a 'visibility' icon, blue color, and size 20px
         ui.button(text='View documents', on_click=lambda: view_documents(project_id), icon='visibility', color='blue').props("size=20px")
@@ -65,5 +94,23 @@ def content(project_id: str) -> None:
         # Add a button to "View reports", which calls view_reports with the project_id when clicked. The button has a 'flag' icon, blue color, and size 20px
         ui.button(text='View reports', on_click=lambda: view_reports(project_id), icon='flag', color='blue').props("size=20px")
         
-        # Add a button to "Generate risk report", which calls generate_report with the project_id when clicked. The button has a 'description' icon, blue color, and size 20px
-        ui.button(text='Generate risk report', on_click=lambda: generate_report(project_id), icon='description', color='blue').props("size=20px")
+        # Add a button to "Generate risk report", which queues a report job for the project_id when clicked. The button has a 'description' icon, blue color, and size 20px
+        generate_button = ui.button(text='Generate risk report', icon='description', color='blue').props("size=20px")
+
+        # Add a button to "Regenerate risk report", which queues a report job that asks the model again instead of reusing its cached answers. The button has a 'refresh' icon, blue color, and size 20px
+        regenerate_button = ui.button(text='Regenerate risk report', icon='refresh', color='blue').props("size=20px")
+
+    # Add labels that show the job progress and the risks while the model generates them, hidden until a job starts
+    progress = ui.label().classes('font-bold')
+    progress.set_visibility(False)
+    output = ui.label().classes('whitespace-pre-wrap max-w-screen-md')
+    output.set_visibility(False)
+    report_buttons = [generate_button, regenerate_button]
+    generate_button.on_click(lambda: follow_job(submit_report_job(project_id), report_buttons, progress, output))
+    regenerate_button.on_click(
+        lambda: follow_job(submit_report_job(project_id, use_cache=False), report_buttons, progress, output))
+
+    # Follow a job that is already running for the project, e.g. one started by another user
+    active_job = get_active_job(project_id)
+    if active_job:
+        follow_job(active_job.id, report_buttons, progress, output)
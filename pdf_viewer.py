@@ -0,0 +1,95 @@
+# Import necessary libraries and modules
+import re
+from fastapi import HTTPException
+from fastapi.responses import Response
+from nicegui import app, ui, run
+from blob_store import blob_path
+from memory_cache import LRUCache
+from constants import VIEWER_ZOOM, VIEWER_THUMBNAIL_ZOOM, VIEWER_CACHE_BYTES
+
+# Rendered pages keyed by (blob hash, page, zoom), bounded by their total size in bytes
+page_cache = LRUCache(VIEWER_CACHE_BYTES, weigher=len)
+
+# Page counts keyed by blob hash, blobs never change so they never go stale
+page_count_cache = LRUCache(1024)
+
+# Blob hashes are SHA-256 hex digests, anything else must not reach the file system
+CONTENT_HASH_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+# Function to count the pages of a PDF in the blob store
+def get_page_count(content_hash: str) -> int:
+    page_count = page_count_cache.get(content_hash)
+    if page_count is None:
+        import fitz  # PyMuPDF, imported on first use of the viewer
+        with fitz.open(blob_path(content_hash), filetype="pdf") as pdf_document:
+            page_count = pdf_document.page_count
+        page_count_cache.set(content_hash, page_count)
+    return page_count
+
+# Function to render a single page (numbered from 1) of a PDF in the blob store to PNG
+def render_page(content_hash: str, page: int, zoom: float) -> bytes:
+    key = (content_hash, page, zoom)
+    png = page_cache.get(key)
+    if png is None:
+        import fitz  # PyMuPDF, imported on first use of the viewer
+        # fitz only reads the parts of the file needed for this page
+        with fitz.open(blob_path(content_hash), filetype="pdf") as pdf_document:
+            pixmap = pdf_document.load_page(page - 1).get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+            png = pixmap.tobytes(output='png')
+        page_cache.set(key, png)
+    return png
+
+# Function to get the URL of a rendered page
+def page_url(content_hash: str, page: int, zoom: float = VIEWER_ZOOM) -> str:
+    return f'/viewer/{content_hash}/{page}.png?zoom={zoom}'
+
+# Route that serves rendered pages, the browser loads them one by one as they are shown
+@app.get('/viewer/{content_hash}/{page}.png')
+async def page_image(content_hash: str, page: int, zoom: float = VIEWER_ZOOM) -> Response:
+    if not app.storage.user.get('authenticated', False):
+        raise HTTPException(status_code=401)
+    if not CONTENT_HASH_PATTERN.match(content_hash):
+        raise HTTPException(status_code=404)
+    zoom = round(min(max(zoom, 0.1), 4.0), 2)  # Bounded zoom keeps the cache keys few and renders cheap
+
+    try:
+        page_count = await run.io_bound(get_page_count, content_hash)
+    except (FileNotFoundError, RuntimeError):
+        raise HTTPException(status_code=404)
+    if not 1 <= page <= page_count:
+        raise HTTPException(status_code=404)
+
+    # Render off the event loop, so other users are not blocked by a large page
+    png = await run.io_bound(render_page, content_hash, page, zoom)
+    # Blobs are content-addressed, so a rendered page never changes and the browser may keep it
+    return Response(content=png, media_type='image/png',
+                    headers={'Cache-Control': 'private, max-age=31536000, immutable'})
+
+# Function to show a PDF from the blob store in a dialog, with page thumbnails that load lazily
+async def show_pdf(filename: str, content_hash: str) -> None:
+    page_count = await run.io_bound(get_page_count, content_hash)
+    current_page = 1
+
+    def show_page(page: int) -> None:
+        nonlocal current_page
+        current_page = min(max(page, 1), page_count)
+        image.set_source(page_url(content_hash, current_page))
+        title.set_text(f'{filename} - Page {current_page}/{page_count}')
+
+    with ui.dialog().props('maximized') as dialog, ui.card().classes('w-full h-full'):
+        with ui.row().classes('w-full items-center'):
+            ui.button('Previous', on_click=lambda: show_page(current_page - 1))
+            title = ui.label().classes('font-bold')
+            ui.button('Next', on_click=lambda: show_page(current_page + 1))
+            ui.space()
+            ui.button('Close', on_click=dialog.close)
+        with ui.row().classes('w-full no-wrap grow'):
+            # Thumbnails are only requested when they scroll into view
+            with ui.scroll_area().classes('w-40 h-full'):
+                for page in range(1, page_count + 1):
+                    ui.image(page_url(content_hash, page, VIEWER_THUMBNAIL_ZOOM)).props('loading=lazy') \
+                        .classes('w-32 cursor-pointer').on('click', lambda page=page: show_page(page))
+            with ui.scroll_area().classes('grow h-full'):
+                image = ui.image().props('fit=contain')
+    show_page(1)
+    dialog.open()
@@ -7,7 +7,7 @@ from nicegui import APIRouter, ui, app
 
 # Import the project page module and database functions
 from pages import project_page
-from db import get_projects, get_project_data
+from db import get_project_summaries
 
 # NOTE: the APIRouter does not yet work with NiceGUI On Air
 # (see https://github.com/zauberzeug/nicegui/discussions/2792)
@@ -19,8 +19,8 @@ router = APIRouter(prefix='/projects')
 def example_page():
     # Define the main project list page
 
-    # Get the list of projects for the current user from the database
-    project_list = get_projects(app.storage.user["id"])
+    # Get the list of projects with their titles for the current user from the database in one query
+    project_list = get_project_summaries(app.storage.user["id"])
 
     # Create a styled frame for the page with a title
     with styles.theme.frame('- Project list -'):
@@ -33,9 +33,7 @@ def example_page():
         # Iterate over the project list and create links for each project
         for project in project_list:
             project_id = project[0]
-            # Get project data from the database using the project ID
-            project_data = get_project_data(project_id)
-            project_title = project_data[0]
+            project_title = project[1]
             
             # Create a link for each project, leading to its detailed page
             ui.link(project_title, f'/projects/{project_id}').classes('text-xl text-grey-8')
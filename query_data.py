@@ -1,14 +1,21 @@
 # Import necessary libraries and modules
 import argparse
-from langchain.vectorstores.chroma import Chroma
-from langchain.prompts import ChatPromptTemplate
-from langchain_community.llms.ollama import Ollama
+import hashlib
+import json
+import re
+from datetime import date
+import numpy as np
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.documents.base import Document
 
-from get_embedding_function import get_embedding_function
-
-# Constants for Chroma database path and prompt template
-CHROMA_PATH = "chroma"
+from chroma_db import get_chroma, get_index_version
+from clients import get_embeddings, get_llm, get_llm_params
+from memory_cache import LRUCache
+from disk_cache import DiskCache
+from constants import (QUERY_CACHE_SIZE, RESPONSE_CACHE_PATH, RESPONSE_CACHE_MAX_ENTRIES, RETRIEVAL_K, RETRIEVAL_MODE, RETRIEVAL_FETCH_K, RETRIEVAL_MMR_LAMBDA,
+                       RETRIEVAL_RERANK_WEIGHT, CONTEXT_TOKEN_BUDGET)
 
+# Constant for the prompt template
 PROMPT_TEMPLATE = """
 Answer the question based only on the following context:
 
@@ -19,24 +26,222 @@ Answer the question based only on the following context:
 Answer the question based on the above context: {question}
 """
 
-# Function to perform retrieval-augmented generation (RAG) query
-def query_rag(query_text: str):
-    # Prepare the Chroma database
-    embedding_function = get_embedding_function()  # Get the embedding function
-    db = Chroma(persist_directory=CHROMA_PATH, embedding_function=embedding_function)  # Initialize Chroma database
+# Options of retrieve that filter chunks by their metadata
+METADATA_FILTERS = ("doc_types", "date_from", "date_to", "filters")
+
+# Reusable retrievers, one per project, kept together with the index version they were opened at
+retrievers = {}
+
+# Caches of query embeddings and search results
+query_embedding_cache = LRUCache(QUERY_CACHE_SIZE)  # Keyed by query text
+retrieval_cache = LRUCache(QUERY_CACHE_SIZE)        # Keyed by (project, index version, query, retrieval options)
+
+# Persistent cache of model answers, keyed by response_cache_key
+response_cache = DiskCache(RESPONSE_CACHE_PATH, RESPONSE_CACHE_MAX_ENTRIES)
+
+# Function to get the retriever of a project, reopened when the project's index changes
+def get_retriever(project_id, index_version):
+    version, db = retrievers.get(project_id, (None, None))
+    if version != index_version:
+        db = get_chroma(project_id)
+        retrievers[project_id] = (index_version, db)
+        # Results cached for older versions of the index can never be used again
+        retrieval_cache.invalidate(lambda key: key[0] == project_id and key[1] != index_version)
+    return db
+
+# Function to embed a query, reusing the embedding of a query that was asked before
+def embed_query(query_text: str):
+    query_embedding = query_embedding_cache.get(query_text)
+    if query_embedding is None:
+        query_embedding = get_embeddings().embed_query(query_text)
+        query_embedding_cache.set(query_text, query_embedding)
+    return query_embedding
+
+# Function to search a project's index, skipping the search if the index did not change since the same query
+#   mode       - "similarity" takes the k closest chunks, "mmr" (maximal marginal relevance) skips near-duplicates
+#   fetch_k    - candidates fetched for min_score, mmr and rerank to choose from
+#   min_score  - minimum cosine similarity between the query and a chunk
+#   rerank     - reorder the candidates with a cheap local lexical re-ranker before choosing k of them
+# Metadata filters, applied inside the vector store so only matching chunks are searched:
+#   doc_types  - only chunks of these document types, e.g. ["charter"]
+#   date_from, date_to - only chunks of documents dated within this range (dates or "YYYY-MM-DD" strings)
+#   filters    - further equality filters on chunk metadata, e.g. {"document_id": 3}
+def retrieve(query_text: str, project_id, k: int = RETRIEVAL_K, mode: str = RETRIEVAL_MODE,
+             fetch_k: int = RETRIEVAL_FETCH_K, min_score=None, rerank: bool = False,
+             doc_types=None, date_from=None, date_to=None, filters=None):
+    index_version = get_index_version(project_id)
+    where = build_where(doc_types, date_from, date_to, filters)
+    key = (project_id, index_version, query_text, k, mode, fetch_k, min_score, rerank, repr(where))
+    results = retrieval_cache.get(key)
+    if results is None:
+        db = get_retriever(project_id, index_version)
+        # Plain similarity search needs no more than k candidates
+        n_results = fetch_k if (mode == "mmr" or min_score is not None or rerank) else k
+        candidates = search_candidates(db, embed_query(query_text), n_results, where)
+
+        if min_score is not None:
+            candidates = [candidate for candidate in candidates if candidate[2] >= min_score]
+        if rerank:
+            candidates = rerank_candidates(query_text, candidates)
+        if mode == "mmr":
+            candidates = select_mmr(candidates, k)
+        results = [(doc, score) for doc, _embedding, score in candidates[:k]]
+        retrieval_cache.set(key, results)
+    return results
+
+# Function to turn metadata filters into a Chroma where clause, None if there are none
+def build_where(doc_types=None, date_from=None, date_to=None, filters=None):
+    conditions = []
+    if doc_types:
+        conditions.append({"doc_type": {"$in": sorted(doc_types)}})
+    # Document dates are stored as YYYYMMDD numbers
+    if date_from:
+        conditions.append({"doc_date": {"$gte": date_number(date_from)}})
+    if date_to:
+        conditions.append({"doc_date": {"$lte": date_number(date_to)}})
+    for field, value in sorted((filters or {}).items()):
+        conditions.append({field: value})
+
+    if not conditions:
+        return None
+    if len(conditions) == 1:
+        return conditions[0]
+    return {"$and": conditions}
+
+# Function to convert a date or a "YYYY-MM-DD" string to the YYYYMMDD number stored in chunk metadata
+def date_number(value) -> int:
+    if isinstance(value, str):
+        value = date.fromisoformat(value)
+    return int(value.strftime("%Y%m%d"))
+
+# Function to fetch the candidates closest to a query embedding as (document, embedding, cosine similarity)
+def search_candidates(db, query_embedding, n_results: int, where=None):
+    # Query the underlying collection, LangChain's wrapper does not return the chunk embeddings MMR needs
+    results = db._collection.query(query_embeddings=[query_embedding], n_results=n_results, where=where,
+                                   include=["documents", "metadatas", "embeddings"])
+    if not results["ids"] or not results["ids"][0]:
+        return []
 
-    # Search the database for similar documents
-    results = db.similarity_search_with_score(query_text, k=5)  # Perform similarity search
+    embeddings = np.array(results["embeddings"][0], dtype=np.float32)
+    query = np.array(query_embedding, dtype=np.float32)
+    similarities = cosine_similarity(embeddings, query)
+    candidates = [(Document(page_content=text, metadata=metadata), embedding, float(similarity))
+                  for text, metadata, embedding, similarity
+                  in zip(results["documents"][0], results["metadatas"][0], embeddings, similarities)]
+    candidates.sort(key=lambda candidate: candidate[2], reverse=True)
+    return candidates
+
+# Function to compute the cosine similarity of every row of a matrix with a vector
+def cosine_similarity(matrix, vector):
+    norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(vector)
+    return matrix @ vector / np.maximum(norms, 1e-12)
+
+# Function to choose k candidates that are relevant to the query but not similar to each other
+def select_mmr(candidates, k: int, lambda_mult: float = RETRIEVAL_MMR_LAMBDA):
+    remaining = list(candidates)
+    selected = []
+    while remaining and len(selected) < k:
+        if not selected:
+            best = 0  # Candidates are sorted, the most relevant one goes first
+        else:
+            chosen = np.array([candidate[1] for candidate in selected])
+            scores = [lambda_mult * candidate[2]
+                      - (1 - lambda_mult) * float(np.max(cosine_similarity(chosen, candidate[1])))
+                      for candidate in remaining]
+            best = int(np.argmax(scores))
+        selected.append(remaining.pop(best))
+    return selected
+
+# Function to reorder candidates by vector similarity combined with the share of query terms they contain
+# The combined score replaces the similarity of each candidate, so MMR weighs relevance by it as well
+def rerank_candidates(query_text: str, candidates):
+    query_terms = set(re.findall(r"\w{3,}", query_text.lower()))
+    if not query_terms:
+        return candidates
+
+    def score(candidate):
+        chunk_terms = set(re.findall(r"\w{3,}", candidate[0].page_content.lower()))
+        overlap = len(query_terms & chunk_terms) / len(query_terms)
+        return (1 - RETRIEVAL_RERANK_WEIGHT) * candidate[2] + RETRIEVAL_RERANK_WEIGHT * overlap
+
+    rescored = [(candidate[0], candidate[1], score(candidate)) for candidate in candidates]
+    return sorted(rescored, key=lambda candidate: candidate[2], reverse=True)
+
+# Function to estimate the number of tokens of a text, about 4 characters per token for English
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+# Function to build the context of a prompt from retrieved chunks, keeping the best ones that fit into the token budget
+def pack_context(results, token_budget: int = CONTEXT_TOKEN_BUDGET) -> str:
+    parts = []
+    used = 0
+    for doc, _score in results:
+        # Cite the source document and page of every chunk
+        part = f"[{doc.metadata.get('source')}, page {doc.metadata.get('page', 1)}]\n{doc.page_content}"
+        tokens = estimate_tokens(part)
+        if used + tokens > token_budget:
+            continue  # A smaller, less relevant chunk may still fit
+        parts.append(part)
+        used += tokens
+    return "\n\n---\n\n".join(parts)
+
+# Function to build the RAG prompt from the context retrieved for a query, returns the prompt and the retrieved chunks
+def build_prompt(query_text: str, project_id, token_budget: int = CONTEXT_TOKEN_BUDGET, **retrieval_options):
+    # Search the project's database for similar documents
+    results = retrieve(query_text, project_id, **retrieval_options)
+    if not results and any(retrieval_options.get(name) for name in METADATA_FILTERS):
+        # E.g. a project without a charter, search all of its documents rather than answer without context
+        print("No chunks match the metadata filters, searching all documents")
+        options = {name: value for name, value in retrieval_options.items() if name not in METADATA_FILTERS}
+        results = retrieve(query_text, project_id, **options)
     print(results)  # Print the search results
 
     # Create context text from search results
-    context_text = "\n\n---\n\n".join([doc.page_content for doc, _score in results])  # Concatenate page content
+    context_text = pack_context(results, token_budget)
     prompt_template = ChatPromptTemplate.from_template(PROMPT_TEMPLATE)  # Create prompt template
     prompt = prompt_template.format(context=context_text, question=query_text)  # Format the prompt with context and question
+    return prompt, results
+
+# Function to get the key of a model answer in the response cache
+# It covers the model with its generation parameters, the prompt template, the question and the retrieved chunks,
+# so the answer is generated again when any of them changes, e.g. after the project's documents are re-indexed
+def response_cache_key(query_text: str, results, token_budget: int, json_output: bool = False) -> str:
+    key = {
+        "model": get_llm_params(json_output),  # Model name and generation parameters
+        "template": PROMPT_TEMPLATE,
+        "question": query_text,
+        "token_budget": token_budget,
+        "chunks": [(doc.metadata.get("id"), doc.page_content) for doc, _score in results],
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+# Function to perform retrieval-augmented generation (RAG) query
+# use_cache=False bypasses the response cache and always asks the model, the new answer still replaces the cached one
+# json_output=True makes the model answer with JSON only, the question has to describe the JSON it should write
+def query_rag(query_text: str, project_id, use_cache: bool = True, json_output: bool = False, **retrieval_options):
+    return "".join(query_rag_stream(query_text, project_id, use_cache, json_output, **retrieval_options))
+
+# Function to perform a RAG query that yields the response tokens as the model produces them
+# A cached answer is yielded at once as a single token; on_context receives the retrieved chunks before it
+def query_rag_stream(query_text: str, project_id, use_cache: bool = True, json_output: bool = False,
+                     on_context=None, **retrieval_options):
+    token_budget = retrieval_options.pop("token_budget", CONTEXT_TOKEN_BUDGET)
+    prompt, results = build_prompt(query_text, project_id, token_budget, **retrieval_options)
+    if on_context:
+        on_context(results)
 
-    # Initialize the language model and generate response
-    model = Ollama(model="mistral")  # Initialize the Ollama model
-    response_text = model.invoke(prompt)  # Invoke the model with the prompt
+    key = response_cache_key(query_text, results, token_budget, json_output)
+    if use_cache:
+        cached = response_cache.get(key)
+        if cached is not None:
+            print(f"Response cache hit {response_cache.stats()}")
+            yield cached.decode("utf-8")
+            return
+        print(f"Response cache miss {response_cache.stats()}")
 
-    # Return the response text
-    return response_text
+    # Stream the response, and cache it only once the model has finished it
+    tokens = []
+    for token in get_llm(json_output).stream(prompt):  # The shared model client
+        tokens.append(token)
+        yield token  # Yield each token as soon as it arrives
+    response_cache.set(key, "".join(tokens).encode("utf-8"))
@@ -0,0 +1,245 @@
+# Import necessary libraries and modules
+import io
+import json
+import html
+import threading
+from xml.sax.saxutils import escape
+from blob_store import put_blob
+from data_access import transaction, fetch_one, fetch_all
+
+# Formats a report can be rendered in, with their media types
+REPORT_FORMATS = {
+    "pdf": "application/pdf",
+    "html": "text/html; charset=utf-8",
+    "json": "application/json",
+}
+
+# Locks that let only one render of a report in a format run at a time, so a double click renders it once
+render_locks = {}
+render_locks_lock = threading.Lock()
+
+# Function to store a generated report with its sections and risks, returns the report ID
+# sections is a list of (title, risks) pairs, a section whose risks are None could not be generated;
+# every risk may carry the IDs of the chunks it is based on in "Sources"
+def save_report(name, project_id, report_date, sections) -> int:
+    with transaction() as conn:
+        report_id = conn.execute('''
+        INSERT INTO reports (name, project_id, report_date)
+        VALUES (?, ?, ?)
+        ''', (name, project_id, report_date)).lastrowid
+        for position, (title, risks) in enumerate(sections):
+            section_id = conn.execute('''
+            INSERT INTO report_sections (report_id, position, title, generated)
+            VALUES (?, ?, ?, ?)
+            ''', (report_id, position, title, int(risks is not None))).lastrowid
+            conn.executemany('''
+            INSERT INTO report_risks (section_id, position, name, description, probability, context, mitigation, sources)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [(section_id, index, risk['Risk Name'], risk['Risk Description'], risk['Probability'],
+                   risk['Context Explanation'], risk['Risk Mitigation Way'], json.dumps(risk.get('Sources', [])))
+                  for index, risk in enumerate(risks or [])])
+    print((name, project_id))
+    return report_id
+
+# Function to load a report with its sections and risks, None if there is no such report
+# Reports created before risks were stored have no sections, only their PDF (content_hash)
+def load_report(report_id):
+    row = fetch_one('SELECT id, name, project_id, report_date, content_hash FROM reports WHERE id=?', (report_id,))
+    if row is None:
+        return None
+    report = {
+        "id": row[0],
+        "name": row[1],
+        "project_id": row[2],
+        "date": row[3],
+        "content_hash": row[4],
+        "sections": [],
+    }
+    sections = {}
+    for section_id, title, generated in fetch_all('''
+    SELECT id, title, generated FROM report_sections WHERE report_id=? ORDER BY position
+    ''', (report_id,)):
+        sections[section_id] = (title, [] if generated else None)
+    if sections:
+        placeholders = ", ".join("?" for _ in sections)
+        for section_id, name, description, probability, context, mitigation, sources in fetch_all(f'''
+        SELECT section_id, name, description, probability, context, mitigation, sources
+        FROM report_risks WHERE section_id IN ({placeholders}) ORDER BY section_id, position
+        ''', list(sections)):
+            sections[section_id][1].append({
+                "Risk Name": name,
+                "Risk Description": description,
+                "Probability": probability,
+                "Context Explanation": context,
+                "Risk Mitigation Way": mitigation,
+                "Sources": json.loads(sources),
+            })
+    report["sections"] = list(sections.values())
+    return report
+
+# Function to get a report rendered in a format, rendered on first use and kept in the blob store afterwards
+# Returns (filename, content_hash, size), or (None, None, None) if the report does not exist in this format
+# Blocking, run it off the event loop
+def get_rendered_report(report_id, format: str):
+    report = load_report(report_id)
+    if report is None or format not in REPORT_FORMATS:
+        return None, None, None
+    filename = report["name"] if report["name"].endswith("." + format) else f'{report["name"]}.{format}'
+    if not report["sections"]:
+        # A report from before risks were stored only exists as the PDF it was created as
+        if format == "pdf" and report["content_hash"]:
+            row = fetch_one('SELECT size FROM reports WHERE id=?', (report_id,))
+            return filename, report["content_hash"], row[0]
+        return None, None, None
+
+    with render_locks_lock:
+        lock = render_locks.setdefault((report_id, format), threading.Lock())
+    with lock:
+        row = fetch_one('SELECT content_hash, size FROM report_renders WHERE report_id=? AND format=?',
+                        (report_id, format))
+        if row is None:
+            data = RENDERERS[format](report)
+            content_hash, size = put_blob(data)
+            with transaction() as conn:
+                conn.execute('''
+                INSERT OR REPLACE INTO report_renders (report_id, format, content_hash, size)
+                VALUES (?, ?, ?, ?)
+                ''', (report_id, format, content_hash, size))
+            row = (content_hash, size)
+    return (filename, ) + tuple(row)
+
+# Function to render a report to PDF
+def render_pdf(report) -> bytes:
+    return create_risk_report(report["sections"], report["date"])
+
+# Function to render a report to a standalone HTML page
+def render_html(report) -> bytes:
+    parts = [
+        '<!DOCTYPE html>',
+        '<html><head><meta charset="utf-8">',
+        f'<title>{html.escape(report["name"])}</title>',
+        '<style>body{font-family:sans-serif;max-width:50rem;margin:2rem auto;line-height:1.5}'
+        'dt{font-weight:bold}dd{margin:0 0 .5rem 1rem}</style>',
+        '</head><body>',
+        '<h1>Risk Management Report</h1>',
+        f'<h2>Date: {html.escape(report["date"] or "")}</h2>',
+    ]
+    idx = 0
+    for title, risks in report["sections"]:
+        parts.append(f'<h2>{html.escape(title)}</h2>')
+        if risks is None:
+            parts.append('<p>This section could not be generated.</p>')
+            continue
+        if not risks:
+            parts.append('<p>No risks were found for this section.</p>')
+            continue
+        for risk in risks:
+            idx += 1
+            parts.append(f'<h3>Risk {idx}:</h3><dl>')
+            for field in ("Risk Name", "Risk Description", "Probability", "Context Explanation", "Risk Mitigation Way"):
+                parts.append(f'<dt>{field}</dt><dd>{html.escape(risk[field])}</dd>')
+            parts.append('</dl>')
+    parts.append('</body></html>')
+    return "\n".join(parts).encode("utf-8")
+
+# Function to render a report to JSON, with the sources of every risk
+def render_json(report) -> bytes:
+    data = {
+        "id": report["id"],
+        "name": report["name"],
+        "project_id": report["project_id"],
+        "date": report["date"],
+        "sections": [
+            {
+                "title": title,
+                "generated": risks is not None,
+                "risks": [{
+                    "name": risk["Risk Name"],
+                    "description": risk["Risk Description"],
+                    "probability": risk["Probability"],
+                    "context": risk["Context Explanation"],
+                    "mitigation": risk["Risk Mitigation Way"],
+                    "sources": risk["Sources"],
+                } for risk in risks or []],
+            }
+            for title, risks in report["sections"]
+        ],
+    }
+    return json.dumps(data, indent=2, ensure_ascii=False).encode("utf-8")
+
+# Renderers by format
+RENDERERS = {
+    "pdf": render_pdf,
+    "html": render_html,
+    "json": render_json,
+}
+
+# Function to create a risk report PDF
+# sections is a list of (title, risks) pairs, a section whose risks are None could not be generated
+# The texts come from the model and are escaped, ReportLab parses paragraphs as markup
+def create_risk_report(sections, current_date):
+    # PDF Report Libraries
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+    from reportlab.lib.units import inch
+
+    # Create an in-memory file object
+    buffer = io.BytesIO()
+    # Create the PDF document
+    doc = SimpleDocTemplate(buffer, pagesize=A4)
+    styles = getSampleStyleSheet()
+    style_normal = styles['Normal']
+    style_heading = styles['Heading1']
+    style_subheading = styles['Heading2']
+    style_risk_heading = styles['Heading3']
+
+    # Define a custom style for the risk section
+    style_risk = ParagraphStyle(
+        'RiskStyle',
+        parent=style_normal,
+        spaceBefore=12,
+        spaceAfter=12,
+        leftIndent=12,
+        rightIndent=12,
+        bulletIndent=12,
+        leading=15
+    )
+
+    elements = []
+
+    # Add a title
+    elements.append(Paragraph("Risk Management Report", style_heading))
+    elements.append(Paragraph(f"Date: {current_date}", style_subheading))
+    elements.append(Spacer(1, 0.4 * inch))
+
+    # Add the sections and their risks to the document, risks are numbered through the whole report
+    idx = 0
+    for title, risks in sections:
+        elements.append(Paragraph(escape(title), style_subheading))
+        if risks is None:
+            elements.append(Paragraph("This section could not be generated.", style_risk))
+            continue
+        if not risks:
+            elements.append(Paragraph("No risks were found for this section.", style_risk))
+            continue
+        for risk in risks:
+            idx += 1
+            elements.append(Paragraph(f"Risk {idx}:", style_risk_heading))
+            elements.append(Paragraph(f"<b>Risk Name:</b> {escape(risk['Risk Name'])}", style_risk))
+            elements.append(Paragraph(f"<b>Risk Description:</b> {escape(risk['Risk Description'])}", style_risk))
+            elements.append(Paragraph(f"<b>Probability:</b> {escape(risk['Probability'])}", style_risk))
+            elements.append(Paragraph(f"<b>Context Explanation:</b> {escape(risk['Context Explanation'])}", style_risk))
+            elements.append(Paragraph(f"<b>Risk Mitigation Way:</b> {escape(risk['Risk Mitigation Way'])}", style_risk))
+            elements.append(Spacer(1, 0.2 * inch))
+
+    # Build the PDF
+    doc.build(elements)
+    # Move to the beginning of the StringIO buffer
+    buffer.seek(0)
+
+    # Get the PDF data from the buffer
+    pdf_data = buffer.getvalue()
+    buffer.close()
+    print("PDF has been generated successfully!")
+    return pdf_data
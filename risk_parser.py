@@ -0,0 +1,131 @@
+# Import necessary libraries and modules
+import json
+import re
+
+# JSON schema of the answer asked from the model in structured output mode
+RISK_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "risks": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string"},
+                    "description": {"type": "string"},
+                    "probability": {"type": "integer", "minimum": 0, "maximum": 100},
+                    "context": {"type": "string"},
+                    "mitigation": {"type": "string"},
+                },
+                "required": ["name", "description", "probability", "context", "mitigation"],
+            },
+        },
+    },
+    "required": ["risks"],
+}
+
+# Fields of a parsed risk, as used by the report, with the keys accepted for them in the model's JSON
+# (keys are compared in lower case without spaces or punctuation, so "Risk Name" matches as well)
+RISK_FIELDS = {
+    "Risk Name": ("name", "riskname"),
+    "Risk Description": ("description", "riskdescription"),
+    "Probability": ("probability",),
+    "Context Explanation": ("context", "contextexplanation"),
+    "Risk Mitigation Way": ("mitigation", "riskmitigationway", "mitigationway"),
+}
+
+class RiskStreamParser:
+    """Parses risks from the JSON answer of the model while it is streamed.
+
+    feed() returns every risk whose object was closed by the new text and has every field of RISK_SCHEMA,
+    close() repairs the risk the answer stopped in, e.g. when the model hit its token limit, so only that
+    one may lack the members that were cut off.
+    """
+
+    def __init__(self) -> None:
+        self.buffer = ""
+        self.position = 0        # Next character of the buffer to scan
+        self.in_string = False
+        self.escaped = False
+        self.object_starts = []  # Buffer positions of the objects that are open, innermost last
+
+    def feed(self, text: str) -> list[dict]:
+        self.buffer += text
+        risks = []
+        while self.position < len(self.buffer):
+            char = self.buffer[self.position]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char == '{':
+                self.object_starts.append(self.position)
+            elif char == '}' and self.object_starts:
+                # An object is complete, it is a risk unless it is e.g. the {"risks": [...]} wrapper
+                start = self.object_starts.pop()
+                risk = parse_risk_object(self.buffer[start:self.position + 1])
+                if risk:
+                    risks.append(risk)
+            self.position += 1
+        return risks
+
+    def close(self) -> list[dict]:
+        if not self.object_starts:
+            return []
+        risk = repair_risk_object(self.buffer[self.object_starts[-1]:], self.in_string)
+        self.object_starts = []
+        return [risk] if risk else []
+
+# Function to parse a risk from the text of a JSON object, None if it is not valid JSON or not a risk
+def parse_risk_object(text: str):
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return None
+    return validate_risk(data)
+
+# Function to repair the text of a JSON object the answer stopped in, returns the risk it holds or None
+# The object is closed as it is, or else without its last members, which may have been cut off; the
+# longest part that is valid JSON keeps every complete member and is the only one checked as a risk
+def repair_risk_object(text: str, in_string: bool):
+    if in_string:
+        text += '"'
+    cut = len(text)
+    while cut > 0:
+        try:
+            data = json.loads(text[:cut].rstrip().rstrip(',') + '}')
+        except ValueError:
+            cut = text.rfind(',', 0, cut)
+            continue
+        return validate_risk(data, partial=True)
+    return None
+
+# Function to turn a decoded JSON value into a risk with the fields of the report, None if it is not a risk
+# A risk needs every field RISK_SCHEMA requires and a probability from 0 to 100; with partial only the name
+# is required, and the fields that are missing are left empty
+def validate_risk(data, partial: bool = False):
+    if not isinstance(data, dict):
+        return None
+    values = {re.sub(r'[^a-z]', '', str(key).lower()): value for key, value in data.items()}
+    risk = {}
+    for field, keys in RISK_FIELDS.items():
+        value = next((values[key] for key in keys if key in values), None)
+        if isinstance(value, (dict, list)):
+            return None  # E.g. the {"risks": [...]} wrapper
+        if value is None and not partial:
+            return None
+        risk[field] = "" if value is None else str(value).strip()
+    if not risk["Risk Name"]:
+        return None
+    if risk["Probability"] or not partial:
+        # The schema asks for a number, the report shows a percentage
+        match = re.fullmatch(r'(\d+(?:\.\d+)?)\s*%?', risk["Probability"])
+        if not match or float(match.group(1)) > 100:
+            return None
+        risk["Probability"] = match.group(1) + "%"
+    return risk
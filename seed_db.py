@@ -0,0 +1,19 @@
+# One-time setup of the database with the sample users, projects and documents
+import argparse
+from db import initialize_db, fill_db, delete_database_file
+from chroma_db import clear_database
+
+def main():
+    parser = argparse.ArgumentParser(description="Add the sample data to the database.")
+    parser.add_argument("--reset", action="store_true", help="Delete the database first, losing all uploaded data.")
+    args = parser.parse_args()
+    if args.reset:
+        for project_id in (1, 2):
+            clear_database(project_id)  # The Chroma collections of the sample projects are rebuilt as well
+        delete_database_file()
+    initialize_db()
+    if fill_db():
+        print("Sample data added.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+# Test that the login and project list pages load without the libraries only the viewer, the report builder
+# or the indexer need, so the app starts quickly
+import json
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules main.py imports before the login page can render, in the order main.py imports them
+PAGE_MODULES = ['project_router', 'authentication', 'downloads', 'pages.home_page', 'styles.theme', 'db']
+
+# Libraries that must be imported on first use of the feature that needs them
+HEAVY_MODULES = ['fitz', 'reportlab', 'PyPDF2', 'langchain', 'langchain_core', 'langchain_community',
+                 'langchain_ollama', 'chromadb', 'numpy', 'matplotlib', 'PIL']
+
+# Script run in a fresh interpreter, prints the heavy modules the page modules loaded
+# NiceGUI is needed by every page, whatever it loads itself is not counted against our modules
+CHECK_SCRIPT = '''
+import importlib, json, sys
+heavy = json.loads(sys.argv[1])
+importlib.import_module('nicegui')
+preloaded = {name for name in heavy if name in sys.modules}
+for name in json.loads(sys.argv[2]):
+    importlib.import_module(name)
+print(json.dumps([name for name in heavy if name in sys.modules and name not in preloaded]))
+'''
+
+def test_pages_do_not_import_heavy_modules(tmp_path):
+    # A fresh interpreter, so modules imported by other tests do not count; the work directory is empty,
+    # so nothing is written next to the repository
+    result = subprocess.run(
+        [sys.executable, '-c', CHECK_SCRIPT, json.dumps(HEAVY_MODULES), json.dumps(PAGE_MODULES)],
+        cwd=tmp_path, env={**os.environ, 'PYTHONPATH': REPO_ROOT}, capture_output=True, text=True, check=True)
+    loaded = json.loads(result.stdout.strip().splitlines()[-1])
+    assert loaded == [], f"Heavy modules loaded by the login and project list pages: {', '.join(loaded)}"
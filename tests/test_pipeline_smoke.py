@@ -0,0 +1,59 @@
+# Smoke test of the pipeline: index a project and ask a question, against the stub Ollama server of the benchmarks
+import math
+import os
+import random
+import sys
+
+import pytest
+
+# The application modules live in the repository root, the stub and the corpus generator in benchmarks/
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.join(REPO_ROOT, "benchmarks"))
+
+from stub_ollama import StubOllama
+from synthetic_corpus import page_text, write_pdf
+
+@pytest.fixture
+def stub(tmp_path, monkeypatch):
+    # The application's paths (db/, chroma/) are relative, so they now point into the temporary directory
+    monkeypatch.chdir(tmp_path)
+    server = StubOllama(embed_latency=0, generate_latency=0, token_latency=0).start()
+    monkeypatch.setenv("OLLAMA_HOST", server.url)
+    monkeypatch.setenv("ANONYMIZED_TELEMETRY", "False")  # No telemetry requests from Chroma
+    yield server
+    server.stop()
+
+def test_index_and_query(stub):
+    # Imported here, after the work directory and the stub are set up, because the caches open their files on import
+    from migrations import migrate
+    from data_access import execute
+    from db import ingest_files
+    from chroma_db import update_chroma, get_chroma, get_index_version
+    from query_data import query_rag
+    from constants import EMBEDDING_BATCH_SIZE
+
+    migrate()
+    project_id = execute('INSERT INTO projects (title) VALUES (?)', ('Smoke test', ))
+    rng = random.Random(0)
+    write_pdf('Project Charter.pdf', [page_text(rng, 400) for _ in range(10)])
+    added, rejected = ingest_files(['Project Charter.pdf'], project_id)
+    assert added == ['Project Charter.pdf'] and not rejected
+
+    # BatchedEmbeddings sends the chunks of the document in batches, one embedding request per batch
+    update_chroma(project_id)
+    chunks = get_chroma(project_id)._collection.count()
+    assert chunks > EMBEDDING_BATCH_SIZE
+    assert stub.requests["embed"] == math.ceil(chunks / EMBEDDING_BATCH_SIZE)
+    assert get_index_version(project_id) == 1
+
+    # Nothing changed, so nothing is embedded again
+    update_chroma(project_id)
+    assert stub.requests["embed"] == math.ceil(chunks / EMBEDDING_BATCH_SIZE)
+    assert get_index_version(project_id) == 1
+
+    # The question is embedded once and answered by the model from the retrieved chunks
+    answer = query_rag("What are the budget risks of the project?", project_id, use_cache=False)
+    assert "Risk Name: Budget Overrun" in answer
+    assert stub.requests["embed"] == math.ceil(chunks / EMBEDDING_BATCH_SIZE) + 1
+    assert stub.requests["generate"] == 1
@@ -0,0 +1,99 @@
+# Tests of the incremental parser of the risks the model answers with in JSON mode
+import json
+import os
+import sys
+
+# The application modules live in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from risk_parser import RiskStreamParser, validate_risk
+
+RISKS = [
+    {"name": "Schedule Delay", "description": "Milestones slip.", "probability": 40,
+     "context": "Deliveries were postponed.", "mitigation": "Add buffers."},
+    {"name": "Budget Overrun", "description": "Costs exceed the budget.", "probability": 30,
+     "context": "Little contingency.", "mitigation": "Review spending monthly."},
+]
+
+# Function to feed a text to a parser in chunks of the given size, returns the risks parsed while feeding
+def feed_in_chunks(parser: RiskStreamParser, text: str, size: int) -> list[dict]:
+    risks = []
+    for i in range(0, len(text), size):
+        risks += parser.feed(text[i:i + size])
+    return risks
+
+def test_feed_returns_each_risk_when_its_object_closes():
+    text = json.dumps({"risks": RISKS}, indent=2)
+    parser = RiskStreamParser()
+    first = text.index("}") + 1  # End of the first risk object
+    assert [risk["Risk Name"] for risk in parser.feed(text[:first])] == ["Schedule Delay"]
+    assert [risk["Risk Name"] for risk in parser.feed(text[first:])] == ["Budget Overrun"]
+    assert parser.close() == []
+
+def test_feed_maps_fields_and_probability():
+    parser = RiskStreamParser()
+    risks = feed_in_chunks(parser, json.dumps({"risks": RISKS[:1]}), 3)
+    assert risks == [{
+        "Risk Name": "Schedule Delay",
+        "Risk Description": "Milestones slip.",
+        "Probability": "40%",
+        "Context Explanation": "Deliveries were postponed.",
+        "Risk Mitigation Way": "Add buffers.",
+    }]
+
+def test_feed_ignores_braces_inside_strings():
+    risk = dict(RISKS[0], description='Uses "{quoted}" braces } and { escapes \\"')
+    parser = RiskStreamParser()
+    risks = feed_in_chunks(parser, json.dumps({"risks": [risk]}), 1)
+    assert [risk["Risk Description"] for risk in risks] == [risk["description"]]
+
+def test_feed_accepts_the_keys_of_the_report():
+    risk = {"Risk Name": "Scope Creep", "Risk Description": "Requirements grow.", "Probability": "45%",
+            "Context Explanation": "Many change requests.", "Risk Mitigation Way": "Change control."}
+    assert RiskStreamParser().feed(json.dumps(risk)) == [risk]
+
+def test_feed_rejects_incomplete_risks():
+    parser = RiskStreamParser()
+    assert parser.feed(json.dumps({"risks": [{"name": "X"}]})) == []
+    assert parser.close() == []
+
+def test_feed_rejects_probability_out_of_range():
+    for probability in (101, -5, "high", ""):
+        risk = dict(RISKS[0], probability=probability)
+        assert RiskStreamParser().feed(json.dumps(risk)) == []
+
+def test_close_repairs_the_risk_the_answer_stopped_in():
+    text = json.dumps({"risks": RISKS}, indent=2)
+    cut = text.index('"context": "Little')  # The second risk stops after its probability
+    parser = RiskStreamParser()
+    assert [risk["Risk Name"] for risk in parser.feed(text[:cut])] == ["Schedule Delay"]
+    assert parser.close() == [{
+        "Risk Name": "Budget Overrun",
+        "Risk Description": "Costs exceed the budget.",
+        "Probability": "30%",
+        "Context Explanation": "",
+        "Risk Mitigation Way": "",
+    }]
+
+def test_close_repairs_a_string_that_was_cut_off():
+    text = json.dumps(RISKS[0])
+    cut = text.index("Deliveries were") + len("Deliveries")
+    parser = RiskStreamParser()
+    assert parser.feed(text[:cut]) == []
+    risk, = parser.close()
+    assert risk["Context Explanation"] == "Deliveries"
+    assert risk["Risk Mitigation Way"] == ""
+
+def test_close_rejects_repaired_risks_without_a_name_or_with_a_bad_probability():
+    parser = RiskStreamParser()
+    parser.feed('{"risks": [{"description": "No name yet", "probability": 20')
+    assert parser.close() == []
+    parser = RiskStreamParser()
+    parser.feed('{"risks": [{"name": "X", "probability": 250, "context": "Cut')
+    assert parser.close() == []
+
+def test_validate_risk_requires_every_field_unless_partial():
+    assert validate_risk({"name": "X"}) is None
+    assert validate_risk({"name": "X"}, partial=True)["Risk Name"] == "X"
+    assert validate_risk({"risks": RISKS}) is None
+    assert validate_risk(["not", "an", "object"]) is None